@@ -0,0 +1,175 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Case, DateTimeField, F, GenericIPAddressField, IntegerField, Value, When
+
+from .metrics import registry
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Отложенная запись активности входа (last_login, счётчик входов, IP).
+# Логин только кладёт запись в буфер; фоновый поток сбрасывает буфер пачкой
+# двумя UPDATE ... CASE раз в flush_interval мс или при flush_size записях.
+# Буфер ограничен max_size пользователями: при переполнении он сбрасывается
+# синхронно, а если БД недоступна - теряются самые старые записи
+
+BUFFER_DEPTH = registry.gauge(
+    'auth_login_activity_buffer', 'Записи активности входа, ожидающие записи в БД',
+)
+FLUSHED = registry.counter(
+    'auth_login_activity_flushed_total', 'Записи активности входа, сохранённые в БД', ['result'],
+)
+
+
+class LoginActivityBuffer:
+
+    def __init__(self, flush_interval_ms=1000, flush_size=500, max_size=100000):
+        # flush_interval_ms=0 - без фонового потока и сброса при выходе:
+        # сброс только по размеру и вручную (так работают тесты и бенчмарки)
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        self.max_size = max_size
+        # user_id -> [last_login, входов, ip]
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, user_id, when, ip=None):
+        if user_id not in self._entries and len(self._entries) >= self.max_size:
+            self.flush()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                if len(self._entries) >= self.max_size:
+                    # сброс не удался - вытесняется самая старая запись
+                    del self._entries[next(iter(self._entries))]
+                    FLUSHED.inc(result='dropped')
+                self._entries[user_id] = [when, 1, ip]
+            else:
+                entry[0] = max(entry[0], when)
+                entry[1] += 1
+                entry[2] = ip or entry[2]
+            size = len(self._entries)
+        if not self.flush_interval:
+            if size >= self.flush_size:
+                self.flush()
+            return
+        if self._stopped.is_set():
+            return
+        self._ensure_thread()
+        if size >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        # запись накопленного; при ошибке записи возвращаются в буфер
+        with self._flush_lock:
+            with self._lock:
+                entries, self._entries = self._entries, {}
+            if not entries:
+                return 0
+            items = list(entries.items())
+            try:
+                for start in range(0, len(items), self.flush_size):
+                    self.write(items[start:start + self.flush_size])
+            except Exception:
+                logger.exception('Не удалось сохранить активность входа')
+                FLUSHED.inc(len(entries), result='error')
+                self._restore(entries)
+                return 0
+            FLUSHED.inc(len(entries), result='ok')
+            return len(entries)
+
+    @staticmethod
+    def write(items):
+        # два UPDATE на пачку: auth_user.last_login и счётчики профиля
+        user_ids = [user_id for user_id, entry in items]
+        with transaction.atomic():
+            User.objects.filter(id__in=user_ids).update(last_login=Case(
+                *[When(id=user_id, then=Value(entry[0])) for user_id, entry in items],
+                default=F('last_login'),
+                output_field=DateTimeField(),
+            ))
+            with_ip = [(user_id, entry[2]) for user_id, entry in items if entry[2]]
+            UserProfile.objects.filter(user_id__in=user_ids).update(
+                login_count=F('login_count') + Case(
+                    *[When(user_id=user_id, then=Value(entry[1])) for user_id, entry in items],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                last_login_ip=Case(
+                    *[When(user_id=user_id, then=Value(ip)) for user_id, ip in with_ip],
+                    default=F('last_login_ip'),
+                    output_field=GenericIPAddressField(),
+                ),
+            )
+
+    def close(self):
+        # остановка фонового потока и последний сброс; вызывается при выходе
+        # из процесса, пока соединения с БД ещё открыты
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return self.flush()
+
+    def _restore(self, entries):
+        with self._lock:
+            for user_id, (when, count, ip) in entries.items():
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    if len(self._entries) < self.max_size:
+                        self._entries[user_id] = [when, count, ip]
+                    else:
+                        FLUSHED.inc(count, result='dropped')
+                else:
+                    entry[0] = max(entry[0], when)
+                    entry[1] += count
+                    entry[2] = entry[2] or ip
+
+    def _ensure_thread(self):
+        # поток создаётся лениво - уже в процессе воркера, а не до fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    # при штатной остановке воркера буфер сбрасывается в БД;
+                    # без потока (flush_interval_ms=0) сброс при выходе не нужен
+                    atexit.register(self.close)
+                self._thread = threading.Thread(target=self._run, name='login-activity-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+
+login_activity = LoginActivityBuffer(
+    flush_interval_ms=settings.LOGIN_ACTIVITY_FLUSH_INTERVAL_MS,
+    flush_size=settings.LOGIN_ACTIVITY_FLUSH_SIZE,
+    max_size=settings.LOGIN_ACTIVITY_MAX_SIZE,
+)
+
+
+def collect_buffer_depth():
+    BUFFER_DEPTH.set(len(login_activity))
+
+
+registry.add_collector(collect_buffer_depth)
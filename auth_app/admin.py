@@ -4,10 +4,16 @@ from .models import Role,BusinessElement,AccessRule, UserProfile
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'role', 'is_deleted']
+    list_filter = ['is_deleted']
+    filter_horizontal = ['roles']
+
+    def get_queryset(self, request):
+        # в админке видны и мягко удалённые профили
+        return UserProfile.all_objects.select_related('user', 'role')
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description']
+    list_display = ['name', 'parent', 'description']
 
 @admin.register(BusinessElement)
 class BusinessElementAdmin(admin.ModelAdmin):
@@ -0,0 +1,108 @@
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.http import quote_etag
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from .activity import login_activity
+from .cache import profile_cache
+from .models import UserProfile
+from .serializers import LoginSerializer, UpdateProfileSerializer, fast_profile_serializer
+from .throttling import client_ip, login_limiter
+from .utils import JWTManager
+from .views import LoginView, MockOrdersView, MockProductsView, MockUsersView, ProfileView
+
+# Async-варианты горячих view для ASGI (включаются настройкой AUTH_ASYNC_VIEWS).
+# Права, ответы и сериализаторы берутся из sync-версий, отличается только I/O
+
+
+class AsyncLoginView(AsyncAPIView, LoginView):
+
+    async def post(self, request):
+        serializer = LoginSerializer(data=request.data, context={'authenticate': False})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await LoginSerializer.aauthenticate(
+                serializer.validated_data['email'],
+                serializer.validated_data['password'],
+            )
+        except serializers.ValidationError as exc:
+            login_limiter.register_failure(serializer.validated_data['email'])
+            return Response({'non_field_errors': exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        login_limiter.register_success(user.email)
+
+        tokens = await sync_to_async(JWTManager.create_token_pair)(user)
+
+        user.last_login = timezone.now()
+        login_activity.add(user.id, user.last_login, client_ip(request))
+
+        return Response(self.get_response_data(user, tokens), status=status.HTTP_200_OK)
+
+
+class AsyncProfileView(AsyncAPIView, ProfileView):
+
+    async def get_profile(self, request):
+        try:
+            return await UserProfile.objects.select_related('user', 'role').aget(user_id=request.user.id)
+        except UserProfile.DoesNotExist:
+            return None
+
+    async def get(self, request):
+        version = await profile_cache.acurrent_version(request.user.id)
+        etag = quote_etag(version)
+        if self.not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = await profile_cache.aget(request.user.id, version)
+        if data is None:
+            profile = await self.get_profile(request)
+            if profile is None:
+                return Response(
+                    {'error': 'Профиль не найден'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            data = fast_profile_serializer.to_representation(profile)
+            await profile_cache.aset(request.user.id, version, data)
+        return Response(data, headers={'ETag': etag})
+
+    async def put(self, request):
+        profile = await self.get_profile(request)
+        if profile is None:
+            return Response(
+                {'error': 'Профиль не найден'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        serializer = UpdateProfileSerializer(profile, data=request.data, partial=True)
+
+        if serializer.is_valid():
+            # запись через sync-сериализатор, чтение выше - без переключения потоков
+            await sync_to_async(serializer.save)()
+            return Response({
+                'message': 'Профиль обновлен',
+                'profile': fast_profile_serializer.to_representation(profile)
+            })
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncMockUsersView(AsyncAPIView, MockUsersView):
+
+    async def get(self, request):
+        return Response(self.mock_response)
+
+
+class AsyncMockProductsView(AsyncAPIView, MockProductsView):
+
+    async def get(self, request):
+        return Response(self.mock_response)
+
+
+class AsyncMockOrdersView(AsyncAPIView, MockOrdersView):
+
+    async def get(self, request):
+        return Response(self.mock_response)
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from rest_framework.authentication import BaseAuthentication
+
+
+class TokenUser:
+    # Пользователь, восстановленный из access-токена без запроса к БД.
+    # Всё, чего нет в токене, берётся из модели User, загружаемой лениво
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.id = self.pk = payload['user_id']
+        self.email = payload.get('email', '')
+        self.role_id = payload.get('role_id')
+        # токены без role_ids выданы до появления нескольких ролей
+        role_ids = payload.get('role_ids')
+        if role_ids is None:
+            role_ids = () if self.role_id is None else (self.role_id,)
+        self.role_ids = tuple(role_ids)
+        self._user = None
+
+    def get_user(self):
+        if self._user is None:
+            self._user = User.objects.select_related('profile').get(pk=self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # вызывается только для атрибутов, которых нет у TokenUser
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.email
+
+
+class JWTMiddlewareAuthentication(BaseAuthentication):
+    # Передаёт в DRF пользователя, уже найденного JWTAuthenticationMiddleware.
+    # Без этого request.user внутри APIView всегда AnonymousUser.
+    # request.auth - payload токена
+
+    def authenticate(self, request):
+        user = getattr(request._request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return (user, getattr(request._request, 'auth_payload', None))
@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AccessRule, BusinessElement, Role
+from .permissions import FLAG_FIELDS, permission_engine
+
+# Массовый импорт/экспорт правил доступа в формате JSON Lines или CSV.
+# Строка: role, element (имена) и флаги can_*. В CSV нужны все колонки,
+# в JSON Lines отсутствующий флаг - False
+
+FORMATS = ('jsonl', 'csv')
+FLAG_NAMES = [field for field, flag in FLAG_FIELDS]
+COLUMNS = ['role', 'element'] + FLAG_NAMES
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', ''}
+# после стольких ошибок разбор прекращается
+MAX_ERRORS = 1000
+
+
+class BulkImportError(Exception):
+    # ошибки валидации; транзакция импорта откатывается целиком
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} ошибок в данных')
+        self.errors = errors
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    normalized = str(value).strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ValueError(f'Неверное логическое значение: {value!r}')
+
+
+def check_columns(fieldnames):
+    # пропущенная или опечатанная колонка иначе молча сбросила бы флаг
+    unknown = [name for name in fieldnames if name not in COLUMNS]
+    missing = [name for name in COLUMNS if name not in fieldnames]
+    errors = []
+    if unknown:
+        errors.append({'line': 1, 'error': f"Неизвестные колонки: {', '.join(unknown)}"})
+    if missing:
+        errors.append({'line': 1, 'error': f"Нет колонок: {', '.join(missing)}"})
+    if errors:
+        raise BulkImportError(errors)
+
+
+def read_rows(lines, fmt):
+    # строки текста -> (номер строки, dict)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        if reader.fieldnames is not None:
+            check_columns(reader.fieldnames)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+
+def import_access_rules(lines, fmt='jsonl', batch_size=5000):
+    # проверка и запись пачками через bulk_create(update_conflicts=True) в одной транзакции.
+    # Возвращает количество обработанных строк
+    role_ids = dict(Role.objects.values_list('name', 'id'))
+    element_ids = dict(BusinessElement.objects.values_list('name', 'id'))
+    rows = read_rows(lines, fmt)
+    errors = []
+    total = 0
+
+    with transaction.atomic():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            now = timezone.now()
+            # повтор пары (role, element) внутри пачки - побеждает последняя строка
+            rules = {}
+            for line_number, row in batch:
+                if not isinstance(row, dict):
+                    errors.append({'line': line_number, 'error': 'Неверный формат строки'})
+                    continue
+                unknown = row.keys() - set(COLUMNS)
+                if unknown:
+                    errors.append({'line': line_number, 'error': f"Неизвестные поля: {', '.join(sorted(map(str, unknown)))}"})
+                    continue
+                role_id = role_ids.get(row.get('role'))
+                element_id = element_ids.get(row.get('element'))
+                if role_id is None:
+                    errors.append({'line': line_number, 'error': f"Неизвестная роль: {row.get('role')!r}"})
+                    continue
+                if element_id is None:
+                    errors.append({'line': line_number, 'error': f"Неизвестный элемент: {row.get('element')!r}"})
+                    continue
+                try:
+                    flags = {name: parse_bool(row.get(name)) for name in FLAG_NAMES}
+                except ValueError as exc:
+                    errors.append({'line': line_number, 'error': str(exc)})
+                    continue
+                rules[(role_id, element_id)] = AccessRule(
+                    role_id=role_id, element_id=element_id, created_at=now, updated_at=now, **flags,
+                )
+            total += len(batch)
+            if len(errors) >= MAX_ERRORS:
+                break
+            if errors:
+                continue
+            AccessRule.objects.bulk_create(
+                rules.values(),
+                update_conflicts=True,
+                unique_fields=['role', 'element'],
+                update_fields=FLAG_NAMES + ['updated_at'],
+            )
+        if errors:
+            raise BulkImportError(errors)
+        # bulk_create не отправляет сигналы - матрицу прав сбрасываем сами
+        transaction.on_commit(permission_engine.invalidate)
+    return total
+
+
+def export_access_rules(fmt='jsonl', chunk_size=5000):
+    # потоковая выгрузка в том же формате, что принимает импорт
+    queryset = AccessRule.objects.order_by('id').values_list('role__name', 'element__name', *FLAG_NAMES)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for values in queryset.iterator(chunk_size=chunk_size):
+            writer.writerow([values[0], values[1]] + [int(value) for value in values[2:]])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for values in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(dict(zip(COLUMNS, values)), ensure_ascii=False) + '\n'
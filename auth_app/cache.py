@@ -0,0 +1,194 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class TokenUserCache:
+    # Ограниченный LRU/TTL кэш пользователей, проверенных по JWT.
+    # Ключ - (user_id, iat) токена, значение - (user, момент истечения)
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, iat):
+        # пользователь из кэша или None
+        key = (user_id, iat)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, iat, user, ttl=None):
+        # ttl не больше времени жизни самого токена
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        key = (user_id, iat)
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, user_id):
+        # сброс всех записей пользователя
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def invalidate_on_commit(self, user_id):
+        # сброс после коммита, чтобы параллельный запрос не закэшировал старые данные
+        transaction.on_commit(lambda: self.invalidate(user_id))
+
+    def invalidate_many(self, user_ids):
+        # сброс записей нескольких пользователей под одной блокировкой
+        with self._lock:
+            for user_id in user_ids:
+                for key in self._keys_by_user.pop(user_id, ()):
+                    self._entries.pop(key, None)
+
+    def invalidate_many_on_commit(self, user_ids):
+        user_ids = list(user_ids)
+        transaction.on_commit(lambda: self.invalidate_many(user_ids))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        # счётчики попаданий/промахов
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+
+user_cache = TokenUserCache(
+    max_size=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL,
+)
+
+
+class ProfileSnapshotCache:
+    # Готовые ответы /profile/ в кэше Django (settings.PROFILE_CACHE_ALIAS).
+    # Версия снимка = общее поколение (меняется при изменении ролей) + версия
+    # пользователя; она же служит ETag. Сброс - удаление версии: следующее чтение
+    # создаст новую случайную, старые снимки истекут по TTL
+
+    GENERATION_KEY = 'profile-snapshot:generation'
+
+    def __init__(self, alias='default', ttl=300):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(user_id):
+        return f'profile-snapshot:version:{user_id}'
+
+    @staticmethod
+    def snapshot_key(user_id, version):
+        return f'profile-snapshot:{user_id}:{version}'
+
+    def version_keys(self, user_id):
+        return [self.GENERATION_KEY, self.version_key(user_id)]
+
+    @staticmethod
+    def join_version(keys, values):
+        return '-'.join(values.get(key, '') for key in keys)
+
+    def current_version(self, user_id):
+        # версия читается до запроса к БД: снимок, собранный после сброса,
+        # всегда сохраняется под новой версией
+        keys = self.version_keys(user_id)
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            for key in missing:
+                # add не перезапишет версию, созданную параллельным запросом
+                self.cache.add(key, uuid.uuid4().hex[:12], None)
+            values = self.cache.get_many(keys)
+        return self.join_version(keys, values)
+
+    async def acurrent_version(self, user_id):
+        keys = self.version_keys(user_id)
+        values = await self.cache.aget_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            for key in missing:
+                await self.cache.aadd(key, uuid.uuid4().hex[:12], None)
+            values = await self.cache.aget_many(keys)
+        return self.join_version(keys, values)
+
+    def get(self, user_id, version):
+        return self.cache.get(self.snapshot_key(user_id, version))
+
+    async def aget(self, user_id, version):
+        return await self.cache.aget(self.snapshot_key(user_id, version))
+
+    def set(self, user_id, version, data):
+        self.cache.set(self.snapshot_key(user_id, version), data, self.ttl)
+
+    async def aset(self, user_id, version, data):
+        await self.cache.aset(self.snapshot_key(user_id, version), data, self.ttl)
+
+    def invalidate(self, user_id):
+        self.cache.delete(self.version_key(user_id))
+
+    def invalidate_on_commit(self, user_id):
+        transaction.on_commit(lambda: self.invalidate(user_id))
+
+    def invalidate_many(self, user_ids):
+        # один delete_many вместо запроса к кэшу на каждого пользователя
+        self.cache.delete_many([self.version_key(user_id) for user_id in user_ids])
+
+    def invalidate_many_on_commit(self, user_ids):
+        user_ids = list(user_ids)
+        transaction.on_commit(lambda: self.invalidate_many(user_ids))
+
+    def invalidate_all(self):
+        # например, после переименования роли
+        self.cache.delete(self.GENERATION_KEY)
+
+
+profile_cache = ProfileSnapshotCache(
+    alias=settings.PROFILE_CACHE_ALIAS,
+    ttl=settings.PROFILE_CACHE_TTL,
+)
@@ -0,0 +1,90 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.permissions import SAFE_METHODS
+
+# Чтение с реплик (settings.DATABASE_REPLICAS). Включается на время безопасных
+# запросов через replica_reads; запись и чтение внутри транзакции - всегда default
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
+
+
+def pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def pin_primary(user_id):
+    # после записи пользователь какое-то время читает с default: реплика может отставать
+    cache.set(pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and bool(cache.get(pin_key(user_id)))
+
+
+async def ais_pinned(user_id):
+    return user_id is not None and bool(await cache.aget(pin_key(user_id)))
+
+
+def replica_allowed(user_id):
+    # реплика настроена и пользователь не привязан к default после своей записи
+    return bool(settings.DATABASE_REPLICAS) and not is_pinned(user_id)
+
+
+async def areplica_allowed(user_id):
+    return bool(settings.DATABASE_REPLICAS) and not await ais_pinned(user_id)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and use_replica.get() and not transaction.get_connection().in_atomic_block:
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    # Для APIView: безопасные методы читают с реплики вне транзакции,
+    # остальные выполняются в транзакции на default, как при ATOMIC_REQUESTS
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return transaction.non_atomic_requests(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        user_id = getattr(getattr(request, 'user', None), 'id', None)
+        if request.method in SAFE_METHODS:
+            with replica_reads(replica_allowed(user_id)):
+                return super().dispatch(request, *args, **kwargs)
+
+        with transaction.atomic():
+            response = super().dispatch(request, *args, **kwargs)
+        if settings.DATABASE_REPLICAS and user_id is not None and response.status_code < 400:
+            pin_primary(user_id)
+        return response
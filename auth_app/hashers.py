@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, BCryptSHA256PasswordHasher
+
+# Хэшеры с параметрами из настроек PASSWORD_*. Параметры записываются в сам хэш,
+# поэтому при их изменении must_update() срабатывает и пароль перехэшируется при входе
+
+
+class PolicyBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+
+    @property
+    def rounds(self):
+        return settings.PASSWORD_BCRYPT_ROUNDS
+
+
+class PolicyArgon2PasswordHasher(Argon2PasswordHasher):
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
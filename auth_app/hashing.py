@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# функции уровня модуля, чтобы их можно было передать в пул процессов
+
+def hash_password(password):
+    # хэш по текущей политике (первый хэшер в PASSWORD_HASHERS)
+    return make_password(password)
+
+
+@functools.lru_cache(maxsize=None)
+def dummy_hash():
+    # хэш случайного пароля по текущей политике; вычисляется один раз на процесс
+    return make_password(secrets.token_urlsafe(16))
+
+
+def verify_password(password, encoded):
+    # (пароль верный, хэш нужно пересчитать по текущей политике).
+    # Без хэша (неизвестный email) или с непригодным хэшем проверка идёт против
+    # dummy_hash(): время ответа не выдаёт, существует ли пользователь
+    encoded = encoded or ''
+    if encoded.startswith('$2'):
+        # голый bcrypt без префикса алгоритма - старые записи
+        try:
+            valid = bcrypt.checkpw(password.encode('utf-8'), encoded.encode('utf-8'))
+        except ValueError:
+            return False, False
+        return valid, valid
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        get_hasher('default').verify(password, dummy_hash())
+        return False, False
+    if not hasher.verify(password, encoded):
+        return False, False
+    preferred = get_hasher('default')
+    return True, hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class HashingServiceBusy(APIException):
+    # очередь хэширования переполнена -> 503 с заголовком Retry-After
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервис перегружен, повторите попытку позже'
+    default_code = 'hashing_busy'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class PasswordHashingService:
+    # Хэширование паролей в ограниченном пуле воркеров.
+    # bcrypt и argon2 отпускают GIL, поэтому пул потоков не блокирует остальные запросы
+
+    def __init__(self, max_workers=4, queue_limit=32, executor='thread', retry_after=1):
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.executor_type = executor
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_workers + queue_limit)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # пул создаётся лениво - уже в процессе воркера, а не до fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.executor_type == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers,
+                            thread_name_prefix='password-hashing',
+                        )
+        return self._executor
+
+    def submit(self, fn, *args):
+        # задача в пул или HashingServiceBusy, если очередь заполнена
+        if not self._slots.acquire(blocking=False):
+            raise HashingServiceBusy(self.retry_after)
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def hash_password(self, password):
+        return self.submit(hash_password, password).result()
+
+    def verify_password(self, password, encoded):
+        return self.submit(verify_password, password, encoded).result()
+
+    async def ahash_password(self, password):
+        # для ASGI: ожидание без блокировки event loop
+        return await asyncio.wrap_future(self.submit(hash_password, password))
+
+    async def averify_password(self, password, encoded):
+        return await asyncio.wrap_future(self.submit(verify_password, password, encoded))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+password_service = PasswordHashingService(
+    max_workers=settings.PASSWORD_HASHING_WORKERS,
+    queue_limit=settings.PASSWORD_HASHING_QUEUE_LIMIT,
+    executor=settings.PASSWORD_HASHING_EXECUTOR,
+    retry_after=settings.PASSWORD_HASHING_RETRY_AFTER,
+)
@@ -0,0 +1,167 @@
+import ipaddress
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+
+from .cache import user_cache
+from .metrics import registry
+from .public_urls import public_view
+
+# Замеры фаз запроса (декодирование токена, поиск пользователя, проверка прав,
+# view, рендеринг) и числа SQL-запросов. Включается настройкой AUTH_INSTRUMENTATION
+
+current_timings = ContextVar('current_timings', default=None)
+
+PHASE_SECONDS = registry.histogram(
+    'auth_request_phase_seconds', 'Длительность фаз обработки запроса', ['phase'],
+)
+REQUEST_SECONDS = registry.histogram(
+    'auth_request_duration_seconds', 'Полное время обработки запроса', ['view', 'status'],
+)
+REQUEST_QUERIES = registry.histogram(
+    'auth_request_db_queries', 'Количество SQL-запросов на запрос', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+USER_CACHE = registry.gauge(
+    'auth_user_cache', 'Кэш пользователей по токену: попадания, промахи, размер', ['stat'],
+)
+
+
+def collect_user_cache_stats():
+    for stat, value in user_cache.stats().items():
+        USER_CACHE.set(value, stat=stat)
+
+
+registry.add_collector(collect_user_cache_stats)
+
+
+class RequestTimings:
+    # фазы одного запроса: имя -> секунды
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.query_time = 0.0
+
+    def add(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def count_query(self, execute, sql, params, many, context):
+        # обёртка connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - started
+
+    def server_timing(self, total):
+        entries = [f'{name};dur={duration * 1000:.2f}' for name, duration in self.phases.items()]
+        entries.append(f'db;desc="{self.queries} queries";dur={self.query_time * 1000:.2f}')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+class phase:
+    # with phase('user_lookup'): ... - замер фазы, если запрос инструментирован
+
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = current_timings.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.started)
+
+
+class RequestInstrumentationMiddleware:
+    # Ставится перед JWTAuthenticationMiddleware. Добавляет заголовок
+    # Server-Timing и пишет гистограммы для /metrics.
+    # Только sync: в async-режиме запросы к БД идут в других потоках
+
+    def __init__(self, get_response):
+        if not settings.AUTH_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        request._timings = timings
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.count_query))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+
+        finished = time.perf_counter()
+        view_started = getattr(request, '_view_started', None)
+        view_finished = getattr(request, '_view_finished', None)
+        if view_started is not None:
+            timings.add('view', (view_finished or finished) - view_started)
+        if view_finished is not None:
+            timings.add('render', finished - view_finished)
+
+        total = finished - timings.started
+        response['Server-Timing'] = timings.server_timing(total)
+
+        view_name = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        for name, duration in timings.phases.items():
+            PHASE_SECONDS.observe(duration, phase=name)
+        PHASE_SECONDS.observe(timings.query_time, phase='db')
+        REQUEST_SECONDS.observe(total, view=view_name, status=response.status_code)
+        REQUEST_QUERIES.observe(timings.queries, view=view_name)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после этого хука - отсюда начинается фаза render
+        request._view_finished = time.perf_counter()
+        return response
+
+
+def metrics_allowed(request):
+    # адрес из AUTH_METRICS_ALLOWED_IPS (REMOTE_ADDR, X-Forwarded-For не учитывается)
+    # или Bearer-токен пользователя с is_staff / ролью admin
+    from .permissions import permission_engine
+    from .utils import JWTManager
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        address = None
+    if address is not None and any(
+        address in ipaddress.ip_network(network, strict=False) for network in settings.AUTH_METRICS_ALLOWED_IPS
+    ):
+        return True
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return False
+    user, payload = JWTManager.authenticate(auth_header[len('Bearer '):])
+    return user is not None and (user.is_staff or permission_engine.has_role(user, 'admin'))
+
+
+@public_view
+def metrics_view(request):
+    # публичный для JWT-middleware (сборщику метрик токен не нужен), доступ проверяется здесь.
+    # Подключается в URLconf только при AUTH_INSTRUMENTATION
+    if not metrics_allowed(request):
+        return JsonResponse({'error': 'Доступ запрещён'}, status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import InvalidKeyError
+
+
+class KeyRing:
+    # Ключи подписи JWT из каталога: <kid>.pem.
+    # Приватный ключ подписывает и проверяет, публичный - только проверяет
+    # (так выводятся из ротации старые ключи, пока живут их токены).
+    # Разобранные ключи проверки кэшируются по kid
+
+    # как часто можно перечитывать каталог при неизвестном kid (сек)
+    RELOAD_INTERVAL = 30
+
+    def __init__(self, keys_dir, algorithm, active_kid=None):
+        self.keys_dir = Path(keys_dir)
+        self.algorithm = algorithm
+        self.active_kid = active_kid or None
+        self._signing = {}
+        self._verifiers = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        # cryptography нужен только для RS256/EdDSA; с HS256 ключи не загружаются
+        try:
+            from cryptography.hazmat.primitives import serialization
+        except ImportError:
+            raise ImproperlyConfigured(f'Для {self.algorithm} нужен пакет cryptography')
+        algorithm = get_default_algorithms()[self.algorithm]
+        signing = {}
+        verifiers = {}
+        for path in sorted(self.keys_dir.glob('*.pem')):
+            # зашифрованный PEM (TypeError) или ключ другого типа иначе
+            # всплыли бы только при подписи/проверке токена
+            try:
+                private_key, public_key = self._read_key(serialization, path.read_bytes())
+                algorithm.prepare_key(public_key)
+            except (TypeError, ValueError, InvalidKeyError) as exc:
+                raise ImproperlyConfigured(f'Ключ {path.name} не подходит для {self.algorithm}: {exc}')
+            if private_key is not None:
+                signing[path.stem] = private_key
+            verifiers[path.stem] = public_key
+        with self._lock:
+            self._signing = signing
+            self._verifiers = verifiers
+            self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _read_key(serialization, data):
+        # (приватный ключ или None, публичный ключ)
+        try:
+            private_key = serialization.load_pem_private_key(data, password=None)
+        except ValueError:
+            return None, serialization.load_pem_public_key(data)
+        return private_key, private_key.public_key()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+
+    def signing_key(self):
+        # (kid, ключ) для подписи новых токенов; по умолчанию - последний по имени
+        self._ensure_loaded()
+        kid = self.active_kid or (max(self._signing) if self._signing else None)
+        if kid not in self._signing:
+            raise ValueError(f'Нет приватного ключа для подписи JWT (kid={kid})')
+        return kid, self._signing[kid]
+
+    def verifier(self, kid):
+        # ключ проверки по kid; при промахе каталог перечитывается не чаще RELOAD_INTERVAL
+        self._ensure_loaded()
+        key = self._verifiers.get(kid)
+        if key is None and time.monotonic() - self._loaded_at > self.RELOAD_INTERVAL:
+            self.load()
+            key = self._verifiers.get(kid)
+        return key
+
+    def jwks(self):
+        # публичные ключи в формате JWKS для сервисов, проверяющих токены у себя
+        self._ensure_loaded()
+        algorithm = get_default_algorithms()[self.algorithm]
+        keys = []
+        for kid, public_key in self._verifiers.items():
+            jwk = json.loads(algorithm.to_jwk(public_key))
+            jwk.update({'kid': kid, 'use': 'sig', 'alg': self.algorithm})
+            keys.append(jwk)
+        return {'keys': keys}
+
+
+key_ring = KeyRing(
+    keys_dir=settings.JWT_KEYS_DIR,
+    algorithm=settings.JWT_ALGORITHM,
+    active_kid=settings.JWT_ACTIVE_KID,
+)
@@ -0,0 +1,150 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import profile_cache, user_cache
+from .models import Role, UserProfile
+from .revocation import revocation_store
+
+# Массовые операции над пользователями: мягкое удаление, восстановление,
+# смена роли. Пользователи выбираются по списку id или фильтру и
+# обрабатываются пачками по chunk_size: на пачку - своя короткая транзакция
+# с несколькими UPDATE и один сброс кэшей после коммита
+
+ACTIONS = ('soft_delete', 'restore', 'reassign_role')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class LifecycleError(Exception):
+    pass
+
+
+def select_user_ids(user_ids=None, role=None, email_domain=None):
+    # id пользователей по списку и/или фильтру, по возрастанию
+    # all_objects: восстановлению нужны как раз удалённые профили
+    queryset = UserProfile.all_objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=list(user_ids))
+    if role is not None:
+        queryset = queryset.filter(role__name=role)
+    if email_domain is not None:
+        queryset = queryset.filter(user__email__iendswith='@' + email_domain.lstrip('@'))
+    return list(queryset.order_by('user_id').values_list('user_id', flat=True))
+
+
+def chunks(user_ids, chunk_size):
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        yield user_ids[start:start + chunk_size]
+
+
+def soft_delete_users(user_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    # возвращает количество удалённых; уже удалённые пропускаются
+    from .utils import JWTManager
+    total = 0
+    for chunk in chunks(user_ids, chunk_size):
+        with transaction.atomic():
+            changed = list(
+                UserProfile.all_objects.select_for_update()
+                .filter(user_id__in=chunk, is_deleted=False)
+                .values_list('user_id', flat=True)
+            )
+            if not changed:
+                continue
+            UserProfile.all_objects.filter(user_id__in=changed).update(is_deleted=True, deleted_at=timezone.now())
+            User.objects.filter(id__in=changed).update(is_active=False)
+            # токены отзываются вместе с удалением, как в UserProfile.soft_delete
+            JWTManager.revoke_users_tokens(changed)
+            profile_cache.invalidate_many_on_commit(changed)
+        total += len(changed)
+    return total
+
+
+def restore_users(user_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    # возвращает количество восстановленных
+    total = 0
+    for chunk in chunks(user_ids, chunk_size):
+        with transaction.atomic():
+            changed = list(
+                UserProfile.all_objects.select_for_update()
+                .filter(user_id__in=chunk, is_deleted=True)
+                .values_list('user_id', flat=True)
+            )
+            if not changed:
+                continue
+            UserProfile.all_objects.filter(user_id__in=changed).update(is_deleted=False, deleted_at=None)
+            User.objects.filter(id__in=changed).update(is_active=True)
+            user_cache.invalidate_many_on_commit(changed)
+            profile_cache.invalidate_many_on_commit(changed)
+        total += len(changed)
+    return total
+
+
+def reassign_role(user_ids, role_name, clear_extra=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    # основная роль для всех выбранных, кроме удалённых; clear_extra - снять дополнительные роли.
+    # Возвращает количество пользователей, у которых что-то изменилось
+    try:
+        role = Role.objects.get(name=role_name)
+    except Role.DoesNotExist:
+        raise LifecycleError(f'Роль {role_name!r} не найдена')
+
+    through = UserProfile.roles.through.objects.filter(userprofile__is_deleted=False)
+    total = 0
+    for chunk in chunks(user_ids, chunk_size):
+        with transaction.atomic():
+            changed = set(
+                UserProfile.objects.filter(user_id__in=chunk)
+                .exclude(role_id=role.id)
+                .values_list('user_id', flat=True)
+            )
+            UserProfile.objects.filter(user_id__in=changed).update(role_id=role.id)
+            if clear_extra:
+                # удаление строк связи напрямую не отправляет m2m_changed - кэши и токены ниже
+                changed.update(
+                    through.filter(userprofile__user_id__in=chunk)
+                    .values_list('userprofile__user_id', flat=True)
+                )
+                through.filter(userprofile__user_id__in=chunk).delete()
+            if not changed:
+                continue
+            # .update() не отправляет post_save: role_ids в выданных access-токенах
+            # устарели, токены отзываются так же, как в signals.revoke_on_role_change
+            revocation_store.revoke_users(changed)
+            user_cache.invalidate_many_on_commit(changed)
+            profile_cache.invalidate_many_on_commit(changed)
+        total += len(changed)
+    return total
+
+
+def purge_deleted_users(older_than, batch_size=DEFAULT_CHUNK_SIZE):
+    # окончательное удаление пользователей, мягко удалённых раньше older_than.
+    # Профиль, токены и связи с ролями удаляются каскадом вместе с пользователем.
+    # Возвращает количество удалённых пользователей
+    queryset = (
+        UserProfile.all_objects.filter(is_deleted=True, deleted_at__lt=older_than)
+        .order_by('deleted_at')
+        .values_list('user_id', flat=True)
+    )
+    total = 0
+    while True:
+        # выборка идёт по частичному индексу profile_deleted_at_idx
+        user_ids = list(queryset[:batch_size])
+        if not user_ids:
+            break
+        with transaction.atomic():
+            User.objects.filter(id__in=user_ids).delete()
+        total += len(user_ids)
+    return total
+
+
+def run(action, user_ids, role=None, clear_extra=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    # общая точка входа для API и команды bulk_users
+    if action == 'soft_delete':
+        return soft_delete_users(user_ids, chunk_size=chunk_size)
+    if action == 'restore':
+        return restore_users(user_ids, chunk_size=chunk_size)
+    if action == 'reassign_role':
+        if not role:
+            raise LifecycleError('Не указана роль')
+        return reassign_role(user_ids, role, clear_extra=clear_extra, chunk_size=chunk_size)
+    raise LifecycleError(f'Неизвестное действие: {action!r}')
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from auth_app import lifecycle
+
+
+class Command(BaseCommand):
+    help = 'Массовое мягкое удаление, восстановление или смена роли пользователей (пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=lifecycle.ACTIONS)
+        parser.add_argument('--ids', type=int, nargs='+', default=None, help='id пользователей')
+        parser.add_argument('--ids-file', default=None, help='Файл с id пользователей, по одному в строке')
+        parser.add_argument('--filter-role', default=None, help='Только пользователи с этой основной ролью')
+        parser.add_argument('--email-domain', default=None, help='Только пользователи с email в этом домене')
+        parser.add_argument('--role', default=None, help='Новая роль для reassign_role')
+        parser.add_argument('--clear-extra-roles', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=lifecycle.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать выбранных пользователей')
+
+    def handle(self, *args, **options):
+        user_ids = options['ids']
+        if options['ids_file']:
+            with open(options['ids_file'], encoding='utf-8') as stream:
+                user_ids = (user_ids or []) + [int(line) for line in stream if line.strip()]
+        if user_ids is None and not options['filter_role'] and not options['email_domain']:
+            raise CommandError('Укажите --ids, --ids-file или фильтр')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть больше нуля')
+
+        selected = lifecycle.select_user_ids(
+            user_ids=user_ids, role=options['filter_role'], email_domain=options['email_domain'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Выбрано пользователей: {len(selected)}')
+            return
+
+        started = time.monotonic()
+        try:
+            count = lifecycle.run(
+                options['action'], selected, role=options['role'],
+                clear_extra=options['clear_extra_roles'], chunk_size=options['chunk_size'],
+            )
+        except lifecycle.LifecycleError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Выбрано: {len(selected)}, изменено: {count} за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth.hashers import Argon2PasswordHasher, BCryptSHA256PasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Подбирает стоимость хэширования паролей под бюджет времени на этом сервере'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget-ms', type=int, default=250, help='Допустимое время одного хэша, мс')
+        parser.add_argument('--algorithm', choices=['bcrypt_sha256', 'argon2'], default='bcrypt_sha256')
+        parser.add_argument('--samples', type=int, default=3, help='Замеров на каждое значение')
+
+    def measure(self, hasher, samples):
+        # медиана нескольких замеров, мс
+        durations = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            hasher.encode('calibrate-password', hasher.salt())
+            durations.append((time.perf_counter() - started) * 1000)
+        return sorted(durations)[len(durations) // 2]
+
+    def calibrate(self, make_hasher, values, samples, budget):
+        # наибольшее значение параметра, укладывающееся в бюджет
+        chosen = None
+        for value in values:
+            duration = self.measure(make_hasher(value), samples)
+            self.stdout.write(f'  {value}: {duration:.1f} мс')
+            if duration > budget:
+                break
+            chosen = value
+        return chosen
+
+    def handle(self, *args, **options):
+        budget = options['budget_ms']
+        samples = options['samples']
+
+        if options['algorithm'] == 'argon2':
+            self.stdout.write('argon2, time_cost:')
+            hasher_class = type('CalibrationArgon2Hasher', (Argon2PasswordHasher,), {})
+
+            def make_hasher(time_cost):
+                hasher = hasher_class()
+                hasher.time_cost = time_cost
+                return hasher
+
+            try:
+                value = self.calibrate(make_hasher, range(1, 11), samples, budget)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            setting = 'PASSWORD_ARGON2_TIME_COST'
+        else:
+            self.stdout.write('bcrypt_sha256, rounds:')
+            hasher_class = type('CalibrationBCryptHasher', (BCryptSHA256PasswordHasher,), {})
+
+            def make_hasher(rounds):
+                hasher = hasher_class()
+                hasher.rounds = rounds
+                return hasher
+
+            try:
+                value = self.calibrate(make_hasher, range(8, 17), samples, budget)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            setting = 'PASSWORD_BCRYPT_ROUNDS'
+
+        if value is None:
+            raise CommandError(f'Даже минимальная стоимость не укладывается в {budget} мс')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'PASSWORD_HASH_ALGORITHM={options["algorithm"]}\n{setting}={value}'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from auth_app import bulk
+
+
+class Command(BaseCommand):
+    help = 'Потоковый экспорт правил доступа в JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='fmt', choices=bulk.FORMATS, default='jsonl')
+        parser.add_argument('--output', '-o', help='Файл для записи (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(bulk.export_access_rules(options['fmt']))
+        else:
+            for chunk in bulk.export_access_rules(options['fmt']):
+                self.stdout.write(chunk, ending='')
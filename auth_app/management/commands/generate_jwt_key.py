@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Создаёт новый ключ подписи JWT (<kid>.pem) в JWT_KEYS_DIR для ротации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kid', help='Идентификатор ключа (по умолчанию - текущая дата и время)')
+        parser.add_argument('--algorithm', default=settings.JWT_ALGORITHM, choices=['RS256', 'EdDSA'])
+        parser.add_argument('--rsa-bits', type=int, default=2048)
+
+    def handle(self, *args, **options):
+        kid = options['kid'] or timezone.now().strftime('%Y%m%d%H%M%S')
+        keys_dir = Path(settings.JWT_KEYS_DIR)
+        keys_dir.mkdir(parents=True, exist_ok=True)
+        path = keys_dir / f'{kid}.pem'
+        if path.exists():
+            raise CommandError(f'Ключ {kid} уже существует')
+
+        if options['algorithm'] == 'EdDSA':
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=options['rsa_bits'])
+
+        path.write_bytes(private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        ))
+        path.chmod(0o600)
+        self.stdout.write(self.style.SUCCESS(f'Ключ создан: {path}'))
@@ -0,0 +1,32 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from auth_app import bulk
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт правил доступа из JSON Lines или CSV (одна транзакция)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл с правилами или '-' для stdin")
+        parser.add_argument('--format', dest='fmt', choices=bulk.FORMATS, default=None,
+                            help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        started = time.monotonic()
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            count = bulk.import_access_rules(stream, fmt, batch_size=options['batch_size'])
+        except bulk.BulkImportError as exc:
+            for error in exc.errors[:20]:
+                self.stderr.write(f"строка {error['line']}: {error['error']}")
+            raise CommandError(str(exc))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Импортировано строк: {count} за {elapsed:.1f} с'))
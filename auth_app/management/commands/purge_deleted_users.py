@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from auth_app import lifecycle
+
+
+class Command(BaseCommand):
+    help = 'Окончательно удаляет пользователей, мягко удалённых больше N дней назад (пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.USER_PURGE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=lifecycle.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--days не может быть отрицательным, --batch-size должен быть больше нуля')
+        older_than = timezone.now() - timedelta(days=options['days'])
+        deleted = lifecycle.purge_deleted_users(older_than, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено пользователей: {deleted}'))
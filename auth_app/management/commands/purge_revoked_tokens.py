@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from auth_app.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Удаляет записи об отозванных токенах, срок действия которых истёк'
+
+    def handle(self, *args, **kwargs):
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
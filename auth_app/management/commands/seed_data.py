@@ -1,13 +1,139 @@
+import multiprocessing
+import random
+import time
+from itertools import product
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import connections, transaction
 from auth_app.models import Role, BusinessElement, AccessRule, UserProfile
+from auth_app.permissions import FLAG_FIELDS
+from auth_app.utils import PasswordHasher
 from django.utils import timezone
 
 
+def user_role_id(seed, index, role_ids):
+    # роль пользователя зависит только от seed и его номера - не от деления на пачки и воркеры
+    if not role_ids:
+        return None
+    return random.Random(f'{seed}:{index}').choice(role_ids)
+
+
+def seed_users_chunk(seed, start, end, role_ids, password_hash, batch_size):
+    # создание пользователей [start, end) с профилями; вызывается и в воркерах
+    created = 0
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(batch_start + batch_size, end)
+        with transaction.atomic():
+            # повторный запуск с тем же seed досоздаёт только недостающих пользователей
+            existing = set(User.objects.filter(
+                username__in=[f'load-{seed}-{i}' for i in range(batch_start, batch_end)],
+            ).values_list('username', flat=True))
+            indexes = [i for i in range(batch_start, batch_end) if f'load-{seed}-{i}' not in existing]
+            users = User.objects.bulk_create([
+                User(
+                    username=f'load-{seed}-{i}',
+                    email=f'load-{seed}-{i}@example.com',
+                    first_name=f'Имя{i}',
+                    last_name=f'Фамилия{i}',
+                    password=password_hash,
+                    is_active=True,
+                )
+                for i in indexes
+            ])
+            UserProfile.objects.bulk_create([
+                UserProfile(user_id=user.pk, role_id=user_role_id(seed, i, role_ids))
+                for i, user in zip(indexes, users)
+            ])
+        created += len(users)
+    return created
+
+
+def seed_users_worker(args):
+    # в дочернем процессе соединения открываются заново
+    return seed_users_chunk(*args)
+
+
 class Command(BaseCommand):
-    help = 'Заполняет базу данных тестовыми данными'
+    help = 'Заполняет базу данных тестовыми данными (или синтетическими данными для нагрузочного тестирования)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, help='Количество синтетических пользователей')
+        parser.add_argument('--roles', type=int, help='Количество синтетических ролей')
+        parser.add_argument('--elements', type=int, help='Количество синтетических бизнес-элементов')
+        parser.add_argument('--rules-density', type=float, default=0.3,
+                            help='Доля пар роль x элемент, для которых создаётся правило')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов для создания пользователей')
+        parser.add_argument('--password', default='load-test-123', help='Пароль всех синтетических пользователей')
+
+    def handle(self, *args, **options):
+        if any(options[name] for name in ('users', 'roles', 'elements')):
+            self.generate(options)
+        else:
+            self.create_fixtures()
+
+    def generate(self, options):
+        # синтетические данные: bulk_create пачками, один заранее вычисленный хэш пароля
+        seed = options['seed']
+        batch_size = options['batch_size']
+        rng = random.Random(seed)
+        started = time.monotonic()
+
+        Role.objects.bulk_create(
+            [Role(name=f'load-{seed}-role-{i}') for i in range(options['roles'] or 0)],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        BusinessElement.objects.bulk_create(
+            [BusinessElement(name=f'load-{seed}-element-{i}') for i in range(options['elements'] or 0)],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        role_ids = list(Role.objects.filter(name__startswith=f'load-{seed}-role-').order_by('id').values_list('id', flat=True))
+        element_ids = list(BusinessElement.objects.filter(name__startswith=f'load-{seed}-element-').order_by('id').values_list('id', flat=True))
+        self.stdout.write(f'Ролей: {len(role_ids)}, элементов: {len(element_ids)}')
+
+        rules = []
+        rules_count = 0
+        for role_id, element_id in product(role_ids, element_ids):
+            if rng.random() >= options['rules_density']:
+                continue
+            bits = rng.getrandbits(len(FLAG_FIELDS))
+            rules.append(AccessRule(
+                role_id=role_id,
+                element_id=element_id,
+                **{field: bool(bits & flag) for field, flag in FLAG_FIELDS},
+            ))
+            if len(rules) >= batch_size:
+                AccessRule.objects.bulk_create(rules, ignore_conflicts=True)
+                rules_count += len(rules)
+                rules = []
+        AccessRule.objects.bulk_create(rules, ignore_conflicts=True)
+        rules_count += len(rules)
+        self.stdout.write(f'Правил доступа: {rules_count}')
+
+        users = options['users'] or 0
+        if users:
+            password_hash = PasswordHasher.hash_password(options['password'])
+            workers = max(1, options['workers'])
+            chunk = -(-users // workers)
+            chunks = [
+                (seed, start, min(start + chunk, users), role_ids, password_hash, batch_size)
+                for start in range(0, users, chunk)
+            ]
+            if workers == 1:
+                created = sum(seed_users_chunk(*args) for args in chunks)
+            else:
+                # соединения родителя нельзя делить с дочерними процессами
+                connections.close_all()
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    created = sum(pool.imap_unordered(seed_users_worker, chunks))
+            self.stdout.write(f'Новых пользователей: {created} (пароль: {options["password"]})')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Синтетические данные созданы за {elapsed:.1f} с'))
 
-    def handle(self, *args, **kwargs):
+    def create_fixtures(self):
         self.stdout.write('Создание тестовых данных...')
 
         # 1. Создание ролей
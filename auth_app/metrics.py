@@ -0,0 +1,130 @@
+import bisect
+import threading
+
+# Минимальный реестр метрик в формате Prometheus (text exposition 0.0.4).
+# Значения хранятся в памяти процесса и отдаются эндпоинтом /metrics
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def escape_label_value(value):
+    # \, " и перевод строки в значении метки экранируются по формату Prometheus
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # счётчики по корзинам (+Inf последней), сумма
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def collect(self):
+        lines = self.header()
+        names = self.labelnames + ('le',)
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(names, key + (bound,))} {cumulative}')
+            labels = format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        # повторная регистрация возвращает уже существующую метрику
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        # функция, обновляющая значения (например, gauge) перед выдачей
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -1,55 +1,100 @@
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .public_urls import PublicURLMatcher
 from .utils import JWTManager
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.http import JsonResponse
-import re
-
-
-class JWTAuthenticationMiddleware(MiddlewareMixin):
-    
-    #  URL не требующиe аутентификации
-    PUBLIC_URLS = [
-        r'^/api/auth/register/$',
-        r'^/api/auth/login/$',
-        r'^/admin/',
-        r'^/admin/login/',
-        r'^/api/docs/',
-    ]
-    
-    def process_request(self, request):
-        
-        path = request.path_info
-        
-        for pattern in self.PUBLIC_URLS:
-            if re.match(pattern, path):
-                request.user = AnonymousUser()
-                return None
-        
+
+
+class JWTAuthenticationMiddleware:
+    # Работает и в WSGI, и в ASGI: в async-режиме пользователь
+    # загружается через async ORM без переключения в поток
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        #  URL не требующиe аутентификации: AUTH_PUBLIC_URLS + view с @public_view
+        self.public_urls = PublicURLMatcher(settings.AUTH_PUBLIC_URLS)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.process_request(request)
+        return response or self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await self.aprocess_request(request)
+        return response or await self.get_response(request)
+
+    def is_public(self, path):
+        return self.public_urls.match(path)
+
+    def get_token(self, request):
+        # (токен, None) или (None, ответ с ошибкой)
         auth_header = request.headers.get('Authorization')
-        
+
         if not auth_header:
-            return JsonResponse(
-                {'error': 'Требуется аутентификация'}, 
+            return None, JsonResponse(
+                {'error': 'Требуется аутентификация'},
                 status=401)
-        
+
         if not auth_header.startswith('Bearer '):
-            return JsonResponse(
-                {'error': 'Неверный формат токена. Используйте: Bearer <token>'}, 
+            return None, JsonResponse(
+                {'error': 'Неверный формат токена. Используйте: Bearer <token>'},
                 status=401)
-        
+
         token = auth_header.split(' ')[1] if len(auth_header.split(' ')) > 1 else None
-        
+
         if not token:
-            return JsonResponse(
-                {'error': 'Токен не предоставлен'}, 
+            return None, JsonResponse(
+                {'error': 'Токен не предоставлен'},
                 status=401)
-        
-        user = JWTManager.get_user_from_token(token)
-        
+
+        return token, None
+
+    def invalid_token_response(self):
+        return JsonResponse(
+            {'error': 'Неверный или просроченный токен'},
+            status=401)
+
+    def process_request(self, request):
+
+        if self.is_public(request.path_info):
+            request.user = AnonymousUser()
+            return None
+
+        token, error = self.get_token(request)
+        if error:
+            return error
+
+        user, payload = JWTManager.authenticate(token)
+
         if not user:
-            return JsonResponse(
-                {'error': 'Неверный или просроченный токен'}, 
-                status=401)
-        
+            return self.invalid_token_response()
+
+        request.user = user
+        request.auth_payload = payload
+        return None
+
+    async def aprocess_request(self, request):
+
+        if self.is_public(request.path_info):
+            request.user = AnonymousUser()
+            return None
+
+        token, error = self.get_token(request)
+        if error:
+            return error
+
+        user, payload = await JWTManager.aauthenticate(token)
+
+        if not user:
+            return self.invalid_token_response()
+
         request.user = user
-        return None
\ No newline at end of file
+        request.auth_payload = payload
+        return None
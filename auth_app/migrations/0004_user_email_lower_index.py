@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+# Функциональный индекс lower(email) для поиска пользователя при логине.
+# Модель User принадлежит django.contrib.auth, поэтому индекс создаётся SQL-ом;
+# в PostgreSQL - CONCURRENTLY, без блокировки записи в таблицу
+
+INDEX_NAME = 'auth_user_email_lower_idx'
+
+
+def create_index(apps, schema_editor):
+    table = schema_editor.quote_name(apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table)
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'CREATE INDEX {concurrently}IF NOT EXISTS {INDEX_NAME} ON {table} (lower(email))')
+
+
+def drop_index(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'DROP INDEX {concurrently}IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('auth_app', '0003_refreshtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0004_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='auth_app.role'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='roles',
+            field=models.ManyToManyField(blank=True, related_name='extra_users', to='auth_app.role'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0005_role_parent_userprofile_roles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='login_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_login_ip',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+# Частичные индексы профиля. В PostgreSQL создаются CONCURRENTLY,
+# без блокировки записи в таблицу (как 0004)
+
+INDEXES = [
+    models.Index(fields=['role'], condition=models.Q(is_deleted=False), name='profile_active_role_idx'),
+    models.Index(fields=['deleted_at'], condition=models.Q(is_deleted=True), name='profile_deleted_at_idx'),
+]
+
+
+def index_kwargs(schema_editor):
+    return {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+
+
+def create_indexes(apps, schema_editor):
+    model = apps.get_model('auth_app', 'UserProfile')
+    for index in INDEXES:
+        schema_editor.execute(index.create_sql(model, schema_editor, **index_kwargs(schema_editor)))
+
+
+def drop_indexes(apps, schema_editor):
+    model = apps.get_model('auth_app', 'UserProfile')
+    for index in INDEXES:
+        schema_editor.execute(index.remove_sql(model, schema_editor, **index_kwargs(schema_editor)))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('auth_app', '0006_userprofile_login_activity'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='userprofile', index=index) for index in INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+        ),
+    ]
@@ -1,12 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .cache import profile_cache, user_cache
 
 
 class Role(models.Model):
     # Роли пользователей
     name = models.CharField(max_length=50,unique=True)
     description = models.TextField(blank=True, null=True)
+    # роль наследует все правила родителя
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children')
     create_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -61,36 +64,87 @@ class AccessRule(models.Model):
 
     def __str__(self):
         return f"{self.role.name} -> {self.element.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # исходная пара (роль, элемент): при её смене старое правило убирается из матрицы прав
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_key = (instance.__dict__.get('role_id'), instance.__dict__.get('element_id'))
+        return instance
     
+class ActiveProfileManager(models.Manager):
+    # по умолчанию мягко удалённые профили не видны; все строки - UserProfile.all_objects.
+    # user.profile и каскадное удаление идут через _base_manager и видят все профили
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class UserProfile(models.Model):
     # Расширенная версия профиля пользователя
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     middle_name = models.CharField(max_length=150, blank=True, null=True)
     role = models.ForeignKey(Role, on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
+    # дополнительные роли; права пользователя - объединение прав всех ролей
+    roles = models.ManyToManyField(Role, blank=True, related_name='extra_users')
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # обновляются пачками из буфера активности входа (activity.py)
+    login_count = models.PositiveIntegerField(default=0)
+    last_login_ip = models.GenericIPAddressField(null=True, blank=True)
+
+    objects = ActiveProfileManager()
+    all_objects = models.Manager()
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # исходная основная роль: при её смене выданные токены (с role_ids) отзываются
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_role_id = instance.__dict__.get('role_id')
+        return instance
+
+    def get_role_ids(self):
+        # основная и дополнительные роли по возрастанию id - отпечаток набора ролей
+        role_ids = {role.id for role in self.roles.all()}
+        if self.role_id is not None:
+            role_ids.add(self.role_id)
+        return tuple(sorted(role_ids))
+
+    def set_user_active(self, is_active):
+        # один UPDATE по полю is_active, без загрузки пользователя
+        User.objects.filter(pk=self.user_id).update(is_active=is_active)
+        if UserProfile.user.is_cached(self):
+            self.user.is_active = is_active
 
     def soft_delete(self):
-        # МЯГккое удаление юзера
+        # МЯГккое удаление юзера: UPDATE только изменившихся полей, повторный вызов ничего не пишет
+        if self.is_deleted:
+            return
         self.is_deleted = True
         self.deleted_at = timezone.now()
-        self.save()
+        UserProfile.all_objects.filter(pk=self.pk).update(is_deleted=True, deleted_at=self.deleted_at)
 
         # деактив
-        self.user.is_active = False
-        self.user.save()
+        self.set_user_active(False)
+
+        # отзыв выданных токенов, чтобы не проверять is_active на каждом запросе
+        from .utils import JWTManager
+        JWTManager.revoke_user_tokens(self.user_id)
+        profile_cache.invalidate_on_commit(self.user_id)
 
     def restore(self):
         # Восстановление пользователя
+        if not self.is_deleted:
+            return
         self.is_deleted = False
         self.deleted_at = None
-        self.save()
+        UserProfile.all_objects.filter(pk=self.pk).update(is_deleted=False, deleted_at=None)
 
         # актив
-        self.user.is_active = True
-        self.user.save()
+        self.set_user_active(True)
+        user_cache.invalidate_on_commit(self.user_id)
+        profile_cache.invalidate_on_commit(self.user_id)
 
     def __str__(self):
         return f"{self.user.email} ({self.role.name if self.role else 'No role'})"
@@ -98,7 +152,44 @@ class UserProfile(models.Model):
     class Meta:
         verbose_name = 'Профиль пользователя'
         verbose_name_plural = 'Профили пользователей'
+        # частичные индексы: списки по роли - только живые профили, очистка - только удалённые
+        indexes = [
+            models.Index(fields=['role'], condition=models.Q(is_deleted=False), name='profile_active_role_idx'),
+            models.Index(fields=['deleted_at'], condition=models.Q(is_deleted=True), name='profile_deleted_at_idx'),
+        ]
 
 
+class RevokedToken(models.Model):
+    # Отозванные токены: конкретный jti или (jti пустой) все токены
+    # пользователя, выданные до revoked_at. Запись живёт до истечения токена
+    jti = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='revoked_tokens')
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
 
+    def __str__(self):
+        return self.jti or f"user {self.user_id} < {self.revoked_at}"
 
+    class Meta:
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+
+
+class RefreshToken(models.Model):
+    # Выданные refresh-токены. При обновлении токен помечается использованным
+    # и заменяется новым из того же семейства; повторное использование
+    # уже обменянного токена отзывает всё семейство
+    jti = models.CharField(max_length=64, unique=True)
+    family = models.CharField(max_length=64, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='refresh_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    used_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.jti
+
+    class Meta:
+        verbose_name = 'Refresh-токен'
+        verbose_name_plural = 'Refresh-токены'
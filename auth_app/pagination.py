@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    # курсор по первичному ключу: стабильная стоимость страницы без COUNT и OFFSET
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
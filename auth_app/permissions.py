@@ -0,0 +1,395 @@
+import random
+import threading
+import time
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import permissions
+
+from .instrumentation import phase
+from .models import AccessRule, BusinessElement, Role
+
+
+# Флаги правила доступа, упакованные в биты
+READ = 1 << 0
+READ_ALL = 1 << 1
+CREATE = 1 << 2
+UPDATE = 1 << 3
+UPDATE_ALL = 1 << 4
+DELETE = 1 << 5
+DELETE_ALL = 1 << 6
+
+FLAG_FIELDS = (
+    ('can_read', READ),
+    ('can_read_all', READ_ALL),
+    ('can_create', CREATE),
+    ('can_update', UPDATE),
+    ('can_update_all', UPDATE_ALL),
+    ('can_delete', DELETE),
+    ('can_delete_all', DELETE_ALL),
+)
+
+# действие -> (флаг для своих объектов, флаг для всех объектов)
+ACTIONS = {
+    'read': (READ, READ_ALL),
+    'create': (CREATE, CREATE),
+    'update': (UPDATE, UPDATE_ALL),
+    'delete': (DELETE, DELETE_ALL),
+}
+
+# сколько разных наборов ролей держать в кэше матрицы
+MAX_ROLE_SETS = 10000
+
+# поколение матрицы в общем кэше: меняется при любом изменении правил, ролей, элементов
+GENERATION_KEY = 'permission-matrix:generation'
+
+
+def pack_flags(rule):
+    # AccessRule (или dict с теми же полями) -> битовая маска
+    bits = 0
+    for field, flag in FLAG_FIELDS:
+        value = rule[field] if isinstance(rule, dict) else getattr(rule, field)
+        if value:
+            bits |= flag
+    return bits
+
+
+def entry_checksum(role_id, element_id, bits):
+    # детерминированный хэш записи матрицы, одинаковый во всех процессах
+    return zlib.crc32(f'{role_id}:{element_id}:{bits}'.encode())
+
+
+def is_allowed(bits, action, owner_id=None, user_id=None):
+    # own-флаг достаточен только для собственных объектов, иначе нужен *_all
+    own_flag, all_flag = ACTIONS[action]
+    if bits & all_flag:
+        return True
+    return owner_id is not None and owner_id == user_id and bool(bits & own_flag)
+
+
+def get_role_ids(user):
+    # id ролей, назначенных пользователю (основная + дополнительные), по возрастанию
+    role_ids = getattr(user, 'role_ids', None)
+    if role_ids is not None:
+        return role_ids
+    try:
+        return user.profile.get_role_ids()
+    except (AttributeError, ObjectDoesNotExist):
+        return ()
+
+
+def get_role_id(user):
+    # id роли пользователя без загрузки самой роли
+    role_id = getattr(user, 'role_id', None)
+    if role_id is not None:
+        return role_id
+    try:
+        return user.profile.role_id
+    except (AttributeError, ObjectDoesNotExist):
+        return None
+
+
+class PermissionMatrix:
+    # Снимок всех правил доступа. Меняется только через update_rule под блокировкой
+    # PermissionEngine; права наборов ролей кэшируются по отпечатку набора
+
+    __slots__ = ('rules', 'by_role', 'parents', 'element_ids', 'element_names', 'role_ids', 'role_sets', 'version')
+
+    def __init__(self, rules, element_ids, role_ids, parents=None):
+        # rules: {(role_id, element_id): bits}; by_role - те же правила по ролям;
+        # parents: {role_id: parent_id}
+        self.rules = rules
+        self.element_ids = element_ids
+        self.element_names = {element_id: name for name, element_id in element_ids.items()}
+        self.role_ids = role_ids
+        self.parents = parents or {}
+        # отпечаток (id ролей по возрастанию) -> (роли с предками, {element_id: bits})
+        self.role_sets = {}
+        self.by_role = {}
+        version = 0
+        for (role_id, element_id), bits in rules.items():
+            self.by_role.setdefault(role_id, {})[element_id] = bits
+            version ^= entry_checksum(role_id, element_id, bits)
+        self.version = version
+
+    def resolve_element(self, element):
+        # имя или id элемента -> id
+        if isinstance(element, int):
+            return element
+        return self.element_ids.get(element)
+
+    def closure(self, role_ids):
+        # роли вместе со всеми предками (цикл в parent не зацикливает обход)
+        result = set()
+        for role_id in role_ids:
+            while role_id is not None and role_id not in result:
+                result.add(role_id)
+                role_id = self.parents.get(role_id)
+        return frozenset(result)
+
+    @staticmethod
+    def combine(by_role, closure, element_id):
+        bits = 0
+        for role_id in closure:
+            bits |= by_role.get(role_id, {}).get(element_id, 0)
+        return bits
+
+    def role_set_flags(self, role_ids):
+        # права набора ролей: OR правил всех ролей и их предков, {element_id: bits}
+        # role_sets читается раньше by_role: update_rule подменяет их в обратном
+        # порядке, поэтому в новый role_sets не попадут права из старого by_role
+        role_sets = self.role_sets
+        entry = role_sets.get(role_ids)
+        if entry is None:
+            by_role = self.by_role
+            closure = self.closure(role_ids)
+            flags = {}
+            for role_id in closure:
+                for element_id, bits in by_role.get(role_id, {}).items():
+                    flags[element_id] = flags.get(element_id, 0) | bits
+            if len(role_sets) >= MAX_ROLE_SETS:
+                role_sets.clear()
+            # если update_rule успел подменить role_sets, запись уйдёт в старый словарь
+            entry = role_sets[role_ids] = (closure, flags)
+        return entry[1]
+
+    def update_rule(self, role_id, element_id, bits):
+        # изменение одного правила: версия пересчитывается через XOR двух записей,
+        # из наборов ролей пересчитываются только содержащие эту роль.
+        # Словари не меняются на месте (их читают без блокировки) - собираются
+        # копии и подменяются ссылки, как с role_sets
+        key = (role_id, element_id)
+        old_bits = self.rules.get(key, 0)
+        if old_bits == bits:
+            return
+        rules = dict(self.rules)
+        role_rules = dict(self.by_role.get(role_id, {}))
+        version = self.version
+        if old_bits:
+            version ^= entry_checksum(role_id, element_id, old_bits)
+        if bits:
+            rules[key] = role_rules[element_id] = bits
+            version ^= entry_checksum(role_id, element_id, bits)
+        else:
+            rules.pop(key, None)
+            role_rules.pop(element_id, None)
+        by_role = dict(self.by_role)
+        if role_rules:
+            by_role[role_id] = role_rules
+        else:
+            by_role.pop(role_id, None)
+
+        role_sets = {}
+        for fingerprint, (closure, flags) in list(self.role_sets.items()):
+            if role_id in closure:
+                flags = dict(flags)
+                combined = self.combine(by_role, closure, element_id)
+                if combined:
+                    flags[element_id] = combined
+                else:
+                    flags.pop(element_id, None)
+            role_sets[fingerprint] = (closure, flags)
+        self.rules = rules
+        self.by_role = by_role
+        self.role_sets = role_sets
+        self.version = version
+
+    @classmethod
+    def load(cls):
+        rules = {}
+        for rule in AccessRule.objects.values('role_id', 'element_id', *dict(FLAG_FIELDS)):
+            bits = pack_flags(rule)
+            if bits:
+                rules[(rule['role_id'], rule['element_id'])] = bits
+        element_ids = dict(BusinessElement.objects.values_list('name', 'id'))
+        role_ids = {}
+        parents = {}
+        for role_id, name, parent_id in Role.objects.values_list('id', 'name', 'parent_id'):
+            role_ids[name] = role_id
+            if parent_id is not None:
+                parents[role_id] = parent_id
+        return cls(rules, element_ids, role_ids, parents)
+
+
+class PermissionEngine:
+    # Проверка прав по матрице роль x элемент, загруженной в память.
+    # Права пользователя - объединение прав всех его ролей (с предками).
+    # Процессы синхронизируются через счётчик поколения в кэше: кто меняет
+    # правила, увеличивает его, остальные раз в check_interval секунд
+    # сверяют счётчик со своим и при расхождении пересобирают матрицу
+
+    def __init__(self, cache_alias='default', check_interval=1):
+        self.cache_alias = cache_alias
+        self.check_interval = check_interval
+        self._matrix = None
+        self._stale = True
+        self._generation = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def matrix(self):
+        if not self._stale and time.monotonic() >= self._next_check:
+            self._sync(self.cache.get(GENERATION_KEY))
+        if self._stale:
+            self.rebuild()
+        return self._matrix
+
+    @property
+    def version(self):
+        return self.matrix.version
+
+    async def amatrix(self):
+        # для async-кода: пересборка (запросы к БД) уходит в поток
+        if not self._stale and time.monotonic() >= self._next_check:
+            self._sync(await self.cache.aget(GENERATION_KEY))
+        if self._stale:
+            await sync_to_async(self.rebuild)()
+        return self._matrix
+
+    def _sync(self, generation):
+        self._next_check = time.monotonic() + self.check_interval
+        if generation != self._generation:
+            self._stale = True
+
+    def current_generation(self):
+        generation = self.cache.get(GENERATION_KEY)
+        if generation is None:
+            # случайное начало: после потери ключа счётчик не совпадёт со старым значением
+            self.cache.add(GENERATION_KEY, random.getrandbits(48), None)
+            generation = self.cache.get(GENERATION_KEY)
+        return generation
+
+    def bump_generation(self):
+        # новое значение счётчика; incr атомарен, поэтому изменение,
+        # сделанное другим процессом одновременно, видно по пропуску значения
+        try:
+            return self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.current_generation()
+            return None
+
+    def rebuild(self):
+        # новая матрица собирается целиком и подменяется одной ссылкой.
+        # Поколение читается до загрузки: изменение во время загрузки вызовет ещё одну пересборку
+        with self._lock:
+            self._stale = False
+            try:
+                generation = self.current_generation()
+                self._matrix = PermissionMatrix.load()
+            except Exception:
+                self._stale = True
+                raise
+            self._generation = generation
+            self._next_check = time.monotonic() + self.check_interval
+        return self._matrix
+
+    def invalidate(self):
+        # пометить матрицу устаревшей в этом и во всех остальных процессах,
+        # пересборка при следующей проверке
+        self._stale = True
+        self.bump_generation()
+
+    def apply_rule(self, role_id, element_id, bits):
+        # точечное обновление одного правила без перезагрузки матрицы из БД.
+        # Если счётчик успел изменить другой процесс, матрица пересобирается целиком
+        with self._lock:
+            generation = self.bump_generation()
+            if self._stale or self._matrix is None:
+                return
+            if generation is None or self._generation is None or generation != self._generation + 1:
+                self._stale = True
+                return
+            self._matrix.update_rule(role_id, element_id, bits)
+            self._generation = generation
+
+    def element_id(self, element):
+        if isinstance(element, BusinessElement):
+            return element.id
+        return self.matrix.resolve_element(element)
+
+    def user_flags(self, user):
+        # (матрица, права пользователя {element_id: bits}) - одна выборка на пачку проверок
+        matrix = self.matrix
+        return matrix, matrix.role_set_flags(get_role_ids(user))
+
+    def get_flags(self, user, element):
+        matrix, flags = self.user_flags(user)
+        if isinstance(element, BusinessElement):
+            return flags.get(element.id, 0)
+        return flags.get(matrix.resolve_element(element), 0)
+
+    def check(self, user, element, action, owner_id=None):
+        return is_allowed(self.get_flags(user, element), action, owner_id, user.id)
+
+    def check_many(self, user, checks):
+        # checks: [(element, action, owner_id)] -> [bool] в том же порядке
+        matrix, flags = self.user_flags(user)
+        return [
+            is_allowed(flags.get(matrix.resolve_element(element), 0), action, owner_id, user.id)
+            for element, action, owner_id in checks
+        ]
+
+    def effective_permissions(self, user):
+        # {имя элемента: {действие: 'all' | 'own' | None}} - только элементы с каким-либо доступом
+        matrix, flags = self.user_flags(user)
+        result = {}
+        for element_id, bits in flags.items():
+            result[matrix.element_names.get(element_id, element_id)] = {
+                action: 'all' if bits & all_flag else 'own' if bits & own_flag else None
+                for action, (own_flag, all_flag) in ACTIONS.items()
+            }
+        return result
+
+    def has_any(self, user, element, action):
+        # есть ли хоть какой-то доступ (к своим или ко всем объектам)
+        own_flag, all_flag = ACTIONS[action]
+        return bool(self.get_flags(user, element) & (own_flag | all_flag))
+
+    def has_role(self, user, role_name):
+        # роль назначена напрямую (наследование прав не делает пользователя членом роли)
+        role_id = self.matrix.role_ids.get(role_name)
+        return role_id is not None and role_id in get_role_ids(user)
+
+
+permission_engine = PermissionEngine(
+    cache_alias=settings.PERMISSION_CACHE_ALIAS,
+    check_interval=settings.PERMISSION_MATRIX_CHECK_INTERVAL,
+)
+
+
+class HasElementPermission(permissions.BasePermission):
+    # Доступ к бизнес-элементу view.business_element по матрице правил.
+    # Коллекция требует *_all, отдельный объект - свой или *_all
+
+    METHOD_ACTIONS = {
+        'GET': 'read',
+        'HEAD': 'read',
+        'OPTIONS': 'read',
+        'POST': 'create',
+        'PUT': 'update',
+        'PATCH': 'update',
+        'DELETE': 'delete',
+    }
+
+    def has_permission(self, request, view):
+        action = self.METHOD_ACTIONS.get(request.method)
+        if action is None or not request.user or not request.user.is_authenticated:
+            return False
+        with phase('permission_check'):
+            if getattr(view, 'kwargs', None):
+                return permission_engine.has_any(request.user, view.business_element, action)
+            return permission_engine.check(request.user, view.business_element, action)
+
+    def has_object_permission(self, request, view, obj):
+        action = self.METHOD_ACTIONS.get(request.method)
+        owner_id = getattr(obj, 'owner_id', None)
+        with phase('permission_check'):
+            return permission_engine.check(request.user, view.business_element, action, owner_id=owner_id)
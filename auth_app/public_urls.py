@@ -0,0 +1,67 @@
+import re
+
+from django.urls import URLPattern, URLResolver, get_resolver
+
+# именованные группы переименовываются, иначе объединённый паттерн не скомпилируется
+NAMED_GROUP = re.compile(r'\(\?P<\w+>')
+# ссылки на группы ((?P=name), \1) в объединённом паттерне указывали бы не туда
+BACKREFERENCE = re.compile(r'\(\?P=\w+\)|\\[1-9]')
+NEVER_MATCH = re.compile(r'(?!)')
+
+
+def public_view(view):
+    # пометить view (класс или функцию) как не требующую аутентификации
+    view.is_public = True
+    return view
+
+
+def is_public_callback(callback):
+    view_class = getattr(callback, 'view_class', None)
+    return getattr(callback, 'is_public', False) or getattr(view_class, 'is_public', False)
+
+
+def collect_public_patterns(patterns, prefix='^/'):
+    # обход URLconf: regex всех маршрутов, чьи view помечены @public_view
+    for entry in patterns:
+        regex = entry.pattern.regex.pattern.lstrip('^')
+        if isinstance(entry, URLResolver):
+            yield from collect_public_patterns(entry.url_patterns, prefix + regex)
+        elif isinstance(entry, URLPattern) and is_public_callback(entry.callback):
+            yield prefix + regex
+
+
+class PublicURLMatcher:
+    # Все публичные маршруты, скомпилированные в один паттерн.
+    # Паттерны со ссылками на группы проверяются отдельно, каждый своим regex.
+    # Компиляция ленивая - при первом запросе, когда URLconf уже загружен
+
+    def __init__(self, patterns=(), include_views=True, urlconf=None):
+        self.patterns = list(patterns)
+        self.include_views = include_views
+        self.urlconf = urlconf
+        self._regex = None
+        self._separate = ()
+
+    @property
+    def regex(self):
+        if self._regex is None:
+            patterns = list(self.patterns)
+            if self.include_views:
+                patterns.extend(collect_public_patterns(get_resolver(self.urlconf).url_patterns))
+            self._separate = tuple(re.compile(p) for p in patterns if BACKREFERENCE.search(p))
+            patterns = [p for p in patterns if not BACKREFERENCE.search(p)]
+            if patterns:
+                combined = '|'.join(f'(?:{NAMED_GROUP.sub("(?:", p)})' for p in patterns)
+                self._regex = re.compile(combined)
+            else:
+                self._regex = NEVER_MATCH
+        return self._regex
+
+    def match(self, path):
+        if self.regex.match(path) is not None:
+            return True
+        return any(regex.match(path) for regex in self._separate)
+
+    def reset(self):
+        self._regex = None
+        self._separate = ()
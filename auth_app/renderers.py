@@ -0,0 +1,46 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    # без orjson - стандартные реализации DRF
+    orjson = None
+
+# JSON-рендерер и парсер на orjson. Типы, которые orjson не знает или
+# форматирует иначе (datetime, Decimal, ленивые строки), отдаются JSONEncoder
+# из DRF, поэтому ответ совпадает со стандартным JSONRenderer
+
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # отступы (Accept: application/json; indent=4) - через стандартный рендерер
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder.default, option=ORJSON_OPTIONS)
+        # как JSONRenderer: U+2028/U+2029 экранируются, иначе ответ - невалидный JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        # orjson принимает только UTF-8 - как и JSON по RFC 8259
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
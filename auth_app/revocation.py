@@ -0,0 +1,145 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class RevocationStore:
+    # Денайлист токенов в памяти процесса. Проверка - O(1) без запросов;
+    # раз в sync_interval секунд подтягиваются записи, добавленные другими процессами
+
+    # запас на транзакции, закоммиченные позже, чем был выставлен revoked_at
+    SYNC_MARGIN = timedelta(seconds=60)
+
+    def __init__(self, sync_interval=5):
+        self.sync_interval = sync_interval
+        self._jtis = {}   # jti -> exp (timestamp)
+        self._users = {}  # user_id -> (revoked_at, exp) (timestamps)
+        self._synced_at = None
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, payload):
+        if time.monotonic() >= self._next_sync:
+            self.refresh()
+        return self._contains(payload)
+
+    async def ais_revoked(self, payload):
+        if time.monotonic() >= self._next_sync:
+            await self.arefresh()
+        return self._contains(payload)
+
+    def _contains(self, payload):
+        jti = payload.get('jti')
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._users.get(payload.get('user_id'))
+        return cutoff is not None and payload.get('iat', 0) <= cutoff[0]
+
+    def _pending_rows(self):
+        # записи с момента прошлой синхронизации (с запасом)
+        queryset = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        if self._synced_at is not None:
+            queryset = queryset.filter(revoked_at__gte=self._synced_at - self.SYNC_MARGIN)
+        return queryset.values_list('jti', 'user_id', 'revoked_at', 'expires_at')
+
+    def _start_sync(self):
+        # True, если синхронизацию выполняет текущий вызов
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return False
+            self._next_sync = time.monotonic() + self.sync_interval
+            return True
+
+    def refresh(self):
+        if not self._start_sync():
+            return
+        synced_at = timezone.now()
+        self._apply(list(self._pending_rows()), synced_at)
+
+    async def arefresh(self):
+        if not self._start_sync():
+            return
+        synced_at = timezone.now()
+        self._apply([row async for row in self._pending_rows()], synced_at)
+
+    def _apply(self, rows, synced_at):
+        with self._lock:
+            for jti, user_id, revoked_at, expires_at in rows:
+                self._add(jti, user_id, revoked_at.timestamp(), expires_at.timestamp())
+            self._purge(time.time())
+            self._synced_at = synced_at
+
+    def _add(self, jti, user_id, revoked_at, expires_at):
+        if jti:
+            self._jtis[jti] = expires_at
+        elif user_id is not None:
+            current = self._users.get(user_id)
+            if current is None or current[0] < revoked_at:
+                self._users[user_id] = (revoked_at, expires_at)
+
+    def _purge(self, now):
+        # записи живут только до истечения соответствующих токенов
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        self._users = {uid: entry for uid, entry in self._users.items() if entry[1] > now}
+
+    def _add_on_commit(self, jti, user_id, revoked_at, expires_at):
+        def add():
+            with self._lock:
+                self._add(jti, user_id, revoked_at, expires_at)
+        transaction.on_commit(add)
+
+    def revoke_token(self, payload):
+        # отзыв одного токена по jti (logout)
+        jti = payload.get('jti')
+        if not jti:
+            return
+        expires_at = datetime.fromtimestamp(payload['exp'], tz=dt_timezone.utc)
+        RevokedToken.objects.get_or_create(
+            jti=jti,
+            defaults={'user_id': payload.get('user_id'), 'expires_at': expires_at},
+        )
+        self._add_on_commit(jti, payload.get('user_id'), time.time(), expires_at.timestamp())
+
+    def revoke_user(self, user_id):
+        # отзыв всех уже выданных access-токенов пользователя (смена пароля, удаление)
+        revoked_at = timezone.now()
+        expires_at = revoked_at + settings.JWT_ACCESS_TOKEN_LIFETIME
+        RevokedToken.objects.create(user_id=user_id, revoked_at=revoked_at, expires_at=expires_at)
+        self._add_on_commit(None, user_id, revoked_at.timestamp(), expires_at.timestamp())
+
+    def revoke_users(self, user_ids):
+        # то же для пачки пользователей: один INSERT и одно обновление денайлиста
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        revoked_at = timezone.now()
+        expires_at = revoked_at + settings.JWT_ACCESS_TOKEN_LIFETIME
+        RevokedToken.objects.bulk_create([
+            RevokedToken(user_id=user_id, revoked_at=revoked_at, expires_at=expires_at)
+            for user_id in user_ids
+        ])
+
+        def add():
+            with self._lock:
+                for user_id in user_ids:
+                    self._add(None, user_id, revoked_at.timestamp(), expires_at.timestamp())
+        transaction.on_commit(add)
+
+    def clear(self):
+        with self._lock:
+            self._jtis = {}
+            self._users = {}
+            self._synced_at = None
+            self._next_sync = 0
+
+    def stats(self):
+        return {'tokens': len(self._jtis), 'users': len(self._users)}
+
+
+revocation_store = RevocationStore(sync_interval=settings.JWT_REVOCATION_SYNC_INTERVAL)
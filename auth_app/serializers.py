@@ -1,8 +1,14 @@
+from operator import attrgetter
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models.functions import Lower
 from .models import UserProfile, Role, BusinessElement, AccessRule
 from django.contrib.auth.password_validation import validate_password
-import bcrypt
+from . import lifecycle
+from .cache import profile_cache, user_cache
+from .permissions import ACTIONS
+from .utils import PasswordHasher
 
 class UserSerializer(serializers.ModelSerializer):
     # Сериализатор для модели Юзера
@@ -28,21 +34,17 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self,validated_data):
         # создание пользователя с хэшированием пароля
         validated_data.pop('password2')
+
+        # хэширование пароля по текущей политике (до записи в БД, в пуле хэширования);
+        # хэш записывается сразу, одним INSERT
         user = User.objects.create(
             username=validated_data['username'],
             email=validated_data['email'],
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
+            password=PasswordHasher.hash_password(validated_data['password']),
         )
 
-        # хэширование пароля с помощью bcrypt
-        password = validated_data['password'].encode('utf-8')
-        hashed_password = bcrypt.hashpw(password,bcrypt.gensalt())
-
-        # сохр хэш пароля 
-        user.set_password(hashed_password.decode('utf-8'))
-        user.save()
-
         return user
     
 
@@ -62,7 +64,9 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 
 class RoleSerializer(serializers.ModelSerializer):
-    # сериализатор для ролей
+    # сериализатор для ролей (поле модели называется create_at)
+    created_at = serializers.DateTimeField(source='create_at', read_only=True)
+
     class Meta:
         model = Role
         fields = ('id','name','description','created_at')
@@ -90,35 +94,126 @@ class AccessRuleSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
 
-class LoginSerializer(serializers.ModelSerializer):
+class LoginSerializer(serializers.Serializer):
     # сериализатор для того чтоб залогиниться
     email = serializers.EmailField(required=True)
     password = serializers.CharField(write_only=True, required=True)
 
     def validate(self, attrs):
-        email=attrs.get('email')
-        password=attrs.get('password')
+        # с context={'authenticate': False} проверяются только поля (для async view)
+        if self.context.get('authenticate', True):
+            attrs['user'] = self.authenticate(attrs.get('email'), attrs.get('password'))
+        return attrs
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+    @staticmethod
+    def get_queryset(email):
+        # один запрос за пользователем, профилем и ролью; поиск по индексу lower(email).
+        # email не уникален - берётся первый зарегистрированный
+        return (
+            User.objects.select_related('profile__role')
+            .alias(email_lower=Lower('email'))
+            .filter(email_lower=email.lower())
+            .order_by('id')
+        )
+
+    @staticmethod
+    def authenticate(email, password):
+        user = LoginSerializer.get_queryset(email).first()
+
+        # пароль проверяется и для неизвестного email (против фиктивного хэша),
+        # хэш по устаревшей политике пересчитывается при успешном входе
+        valid, needs_rehash = PasswordHasher.verify(password, user.password if user else None)
+        if user is None or not valid:
             raise serializers.ValidationError('Неверный email или пароль')
         
-        # проверка пароля с помоьщю bcrypt
-        password_bytes = password.encode('utf-8')
-        stored_password = user.password.encode('utf-8') if isinstance(user.password,str) else user.password
+        if not user.is_active:
+            raise serializers.ValidationError(('Ваш аккаунт был деактивирован'))
 
-        if not bcrypt.checkpw(password_bytes,stored_password):
+        if needs_rehash:
+            PasswordHasher.set_password(user, password)
+            user.save(update_fields=['password'])
+
+        return user
+
+    @staticmethod
+    async def aauthenticate(email, password):
+        # async-версия: async ORM + ожидание пула хэширования
+        user = await LoginSerializer.get_queryset(email).afirst()
+
+        valid, needs_rehash = await PasswordHasher.averify(password, user.password if user else None)
+        if user is None or not valid:
             raise serializers.ValidationError('Неверный email или пароль')
-        
+
         if not user.is_active:
             raise serializers.ValidationError(('Ваш аккаунт был деактивирован'))
 
-        attrs['user'] = user
-        return attrs
+        if needs_rehash:
+            user.password = await PasswordHasher.ahash_password(password)
+            await user.asave(update_fields=['password'])
+
+        return user
 
 
     
+class TokenRefreshSerializer(serializers.Serializer):
+    # сериализатор для обновления пары токенов
+    refresh = serializers.CharField(required=True)
+
+
+class ChangePasswordSerializer(serializers.Serializer):
+    # сериализатор для смены пароля
+    old_password = serializers.CharField(write_only=True, required=True)
+    new_password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
+    new_password2 = serializers.CharField(write_only=True, required=True)
+
+    def validate(self, attrs):
+        if attrs['new_password'] != attrs['new_password2']:
+            raise serializers.ValidationError({"new_password":"Пароли не совпадают"})
+
+        user = self.context['request'].user
+        if not PasswordHasher.check_password(attrs['old_password'], user.password):
+            raise serializers.ValidationError({"old_password":"Неверный пароль"})
+        return attrs
+
+    def save(self):
+        # пароль хранится так же, как при регистрации;
+        # request.user может быть общим объектом из кэша, поэтому берём свежий
+        user = User.objects.get(pk=self.context['request'].user.pk)
+        PasswordHasher.set_password(user, self.validated_data['new_password'])
+        user.save(update_fields=['password'])
+        return user
+
+
+class PermissionCheckItemSerializer(serializers.Serializer):
+    # одна проверка: элемент (имя), действие и, для своих объектов, владелец
+    element = serializers.CharField()
+    action = serializers.ChoiceField(choices=list(ACTIONS))
+    owner_id = serializers.IntegerField(required=False, allow_null=True)
+
+
+class PermissionCheckSerializer(serializers.Serializer):
+    checks = PermissionCheckItemSerializer(many=True, max_length=1000)
+
+
+class UserBulkActionSerializer(serializers.Serializer):
+    # массовая операция: пользователи по списку id и/или фильтру (role, email_domain)
+    action = serializers.ChoiceField(choices=list(lifecycle.ACTIONS))
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=100000)
+    filter_role = serializers.CharField(required=False)
+    email_domain = serializers.CharField(required=False)
+    role = serializers.CharField(required=False)
+    clear_extra_roles = serializers.BooleanField(default=False)
+    chunk_size = serializers.IntegerField(default=lifecycle.DEFAULT_CHUNK_SIZE, min_value=1, max_value=10000)
+
+    def validate(self, data):
+        if not any(key in data for key in ('user_ids', 'filter_role', 'email_domain')):
+            # без условий операция затронула бы всех пользователей
+            raise serializers.ValidationError('Укажите user_ids или фильтр')
+        if data['action'] == 'reassign_role' and not data.get('role'):
+            raise serializers.ValidationError({'role': 'Не указана роль'})
+        return data
+
+
 class UpdateProfileSerializer(serializers.ModelSerializer):
     # сериализатор для обновления профиля
     email = serializers.EmailField(source='user.email',required=False)
@@ -130,24 +225,79 @@ class UpdateProfileSerializer(serializers.ModelSerializer):
         fields=('middle_name', 'email', 'first_name', 'last_name')
 
     def update(self,instance,validated_data):
-        # обновление данных юзера
+        # обновление данных юзера: в БД пишутся только изменившиеся поля,
+        # без изменений - ни одного запроса на запись
         user_data = validated_data.pop('user',{})
         user=instance.user
 
+        user_fields = []
+        for field in ('email', 'first_name', 'last_name'):
+            if field in user_data and getattr(user, field) != user_data[field]:
+                setattr(user, field, user_data[field])
+                user_fields.append(field)
+
+        profile_fields = []
+        if 'middle_name' in validated_data and instance.middle_name != validated_data['middle_name']:
+            instance.middle_name = validated_data['middle_name']
+            profile_fields.append('middle_name')
+
+        if user_fields:
+            user.save(update_fields=user_fields)
+        if profile_fields:
+            instance.save(update_fields=profile_fields)
+        if user_fields or profile_fields:
+            user_cache.invalidate_on_commit(user.id)
+            profile_cache.invalidate_on_commit(user.id)
 
-        if 'email' in user_data:
-            user.email = user_data['email']
-        if 'first_name' in user_data:
-            user.first_name = user_data['first_name']
-        if 'last_name' in user_data:
-            user.last_name = user_data['last_name']
+        return instance
+            
 
-        user.save()
 
-        instance.middle_name = validated_data.get('middle_name', instance.middle_name)
-        instance.save()
 
-        return instance
-            
 
 
+class AttrSerializer:
+    # Лёгкая сериализация для горячих путей: поля читаются заранее собранными
+    # attrgetter, без создания Field на каждый объект. Значение поля - путь
+    # к атрибуту или (путь, функция преобразования не-None значения)
+
+    def __init__(self, **fields):
+        self.fields = []
+        for name, spec in fields.items():
+            path, convert = spec if isinstance(spec, tuple) else (spec, None)
+            self.fields.append((name, attrgetter(path), convert))
+
+    def to_representation(self, instance):
+        data = {}
+        for name, getter, convert in self.fields:
+            try:
+                value = getter(instance)
+            except AttributeError:
+                # None в середине пути или нет связанного объекта (профиль без роли)
+                value = None
+            if value is not None and convert is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+
+# формат дат как у DRF (DATETIME_FORMAT и часовой пояс)
+datetime_to_representation = serializers.DateTimeField().to_representation
+
+fast_user_serializer = AttrSerializer(
+    id='id', username='username', email='email', first_name='first_name', last_name='last_name',
+)
+# те же поля, что у UserProfileSerializer
+fast_profile_serializer = AttrSerializer(
+    id='id',
+    user=('user', fast_user_serializer.to_representation),
+    middle_name='middle_name',
+    role='role_id',
+    role_name='role.name',
+    is_deleted='is_deleted',
+    deleted_at=('deleted_at', datetime_to_representation),
+    created_at=('created_at', datetime_to_representation),
+)
+fast_login_user_serializer = AttrSerializer(
+    id='id', email='email', first_name='first_name', last_name='last_name',
+)
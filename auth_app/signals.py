@@ -0,0 +1,95 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import profile_cache, user_cache
+from .models import AccessRule, BusinessElement, Role, UserProfile
+from .permissions import pack_flags, permission_engine
+from .revocation import revocation_store
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=BusinessElement)
+@receiver(post_delete, sender=BusinessElement)
+def invalidate_permission_matrix(sender, **kwargs):
+    # матрица прав пересобирается после коммита изменений
+    transaction.on_commit(permission_engine.invalidate)
+
+
+@receiver(post_save, sender=AccessRule)
+@receiver(post_delete, sender=AccessRule)
+def update_permission_rule(sender, instance, signal, **kwargs):
+    # одно правило меняется в матрице точечно, без перезагрузки из БД
+    key = (instance.role_id, instance.element_id)
+    loaded_key = getattr(instance, '_loaded_key', None) or key
+    changes = []
+    if loaded_key != key or signal is post_delete:
+        changes.append((*loaded_key, 0))
+    if signal is post_save:
+        changes.append((*key, pack_flags(instance)))
+        instance._loaded_key = key
+
+    def apply():
+        for change in changes:
+            permission_engine.apply_rule(*change)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_profile_snapshots(sender, **kwargs):
+    # имя роли есть в каждом снимке профиля
+    transaction.on_commit(profile_cache.invalidate_all)
+
+
+# поля пользователя, которых нет в снимке профиля (пересчёт хэша при входе и т.п.)
+NON_SNAPSHOT_USER_FIELDS = frozenset({'password', 'last_login'})
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_snapshot(sender, instance, update_fields=None, **kwargs):
+    # любое сохранение через ORM (админка, shell, сериализаторы) меняет ETag профиля.
+    # QuerySet.update() сигналов не отправляет - такие места сбрасывают кэш сами
+    if sender is User and update_fields and NON_SNAPSHOT_USER_FIELDS.issuperset(update_fields):
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    user_cache.invalidate_on_commit(user_id)
+    profile_cache.invalidate_on_commit(user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def revoke_on_role_change(sender, instance, created, **kwargs):
+    # role_ids зашиты в access-токен: после смены основной роли старые токены отзываются.
+    # Про профиль, загруженный не из БД, неизвестно, менялась ли роль - отзыв на всякий случай
+    if not created and getattr(instance, '_loaded_role_id', object()) != instance.role_id:
+        revocation_store.revoke_user(instance.user_id)
+    instance._loaded_role_id = instance.role_id
+
+
+@receiver(m2m_changed, sender=UserProfile.roles.through)
+def invalidate_user_roles(sender, instance, action, pk_set, **kwargs):
+    # набор ролей пользователя закэширован вместе с пользователем и зашит в access-токены
+    if action == 'pre_clear' and not isinstance(instance, UserProfile):
+        # после role.extra_users.clear() затронутых профилей уже не найти
+        instance._cleared_user_ids = list(instance.extra_users.values_list('user_id', flat=True))
+        return
+    if not action.startswith('post_') or (action != 'post_clear' and not pk_set):
+        return
+    if isinstance(instance, UserProfile):
+        user_ids = [instance.user_id]
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_user_ids', [])
+    else:
+        # изменение со стороны роли: role.extra_users.add(...)
+        user_ids = list(UserProfile.all_objects.filter(pk__in=pk_set or ()).values_list('user_id', flat=True))
+    if not user_ids:
+        return
+    revocation_store.revoke_users(user_ids)
+    user_cache.invalidate_many_on_commit(user_ids)
+    profile_cache.invalidate_many_on_commit(user_ids)
@@ -1,3 +1,1385 @@
-from django.test import TestCase
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+import jwt
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+
+from . import hashing
+from .db import replica_reads
+from .models import AccessRule, BusinessElement, Role, UserProfile
+from .permissions import permission_engine
+from .serializers import LoginSerializer
+from .throttling import LoginLimiter, MemoryBackend
+from .utils import JWTManager
+
+try:
+    import adrf
+except ImportError:
+    adrf = None
+
+try:
+    import cryptography
+except ImportError:
+    cryptography = None
+
+
+def make_user(username, role=None, **fields):
+    # пользователь с профилем; email по умолчанию - <username>@example.com
+    fields.setdefault('email', f'{username}@example.com')
+    user = User.objects.create(username=username, **fields)
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {JWTManager.create_token(user)}'}
+
+
+class TokenRefreshTests(TestCase):
+
+    def setUp(self):
+        from .revocation import revocation_store
+
+        self.addCleanup(revocation_store.clear)
+        role = Role.objects.create(name='user')
+        self.user = make_user('user', role=role)
+        self.user.profile.roles.add(Role.objects.create(name='auditor'))
+        self.tokens = JWTManager.create_token_pair(self.user)
+
+    def refresh(self, token):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': token}, content_type='application/json')
+
+    def test_rotation(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        tokens = response.json()
+        self.assertNotEqual(tokens['refresh'], self.tokens['refresh'])
+        payload = JWTManager.decode_token(tokens['token'])
+        self.assertEqual(len(payload['role_ids']), 2)
+        # FOR UPDATE - только по таблице токенов, без соединения с профилем
+        locking = [q['sql'] for q in context.captured_queries if 'FOR UPDATE' in q['sql']]
+        self.assertTrue(all('auth_app_userprofile' not in sql for sql in locking))
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 200)
+
+    def test_reuse_revokes_family(self):
+        rotated = self.refresh(self.tokens['refresh']).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 401)
+        # выданный при ротации refresh-токен отозван вместе с семейством, access - тоже
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, 401)
+        response = self.client.get('/api/auth/profile/', HTTP_AUTHORIZATION=f"Bearer {rotated['token']}")
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired(self):
+        import time
+
+        now = time.time()
+        token = JWTManager.encode({
+            'type': 'refresh', 'user_id': self.user.id, 'jti': 'expired', 'family': 'expired',
+            'exp': now - 10, 'iat': now - 100,
+        })
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'Токен истёк')
+
+    def test_inactive_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_legacy_token_without_type_is_rejected(self):
+        import time
+
+        now = time.time()
+        token = JWTManager.encode({'user_id': self.user.id, 'email': self.user.email, 'exp': now + 3600, 'iat': now})
+        self.assertEqual(JWTManager.authenticate(token), (None, None))
+        response = self.client.get('/api/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+
+@skipUnless(cryptography, 'нужен пакет cryptography')
+class KeyRingTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.keys_dir = directory.name
+        self.private_keys = {kid: self.write_key(kid) for kid in ('k1', 'k2')}
+
+    def write_key(self, kid):
+        from pathlib import Path
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        Path(self.keys_dir, f'{kid}.pem').write_bytes(private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ))
+        return private_key
+
+    def retire(self, kid):
+        # в каталоге остаётся только публичный ключ
+        from pathlib import Path
+        from cryptography.hazmat.primitives import serialization
+
+        Path(self.keys_dir, f'{kid}.pem').write_bytes(self.private_keys[kid].public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ))
+
+    def use_ring(self, ring):
+        for patcher in (
+            mock.patch.object(JWTManager, 'ALGORITHM', 'EdDSA'),
+            mock.patch('auth_app.utils.key_ring', ring),
+            mock.patch('auth_app.views.key_ring', ring),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_rotation_with_retired_key(self):
+        from .keys import KeyRing
+
+        user = make_user('user')
+        self.use_ring(KeyRing(self.keys_dir, 'EdDSA', active_kid='k1'))
+        old_token = JWTManager.create_token(user)
+
+        ring = KeyRing(self.keys_dir, 'EdDSA')
+        self.use_ring(ring)
+        self.retire('k1')
+        ring.load()
+        # подписывает последний приватный ключ, старый только проверяет
+        self.assertEqual(ring.signing_key()[0], 'k2')
+        new_token = JWTManager.create_token(user)
+        self.assertEqual(jwt.get_unverified_header(new_token)['kid'], 'k2')
+        self.assertEqual(JWTManager.decode_token(old_token)['user_id'], user.id)
+        self.assertEqual(JWTManager.decode_token(new_token)['user_id'], user.id)
+
+        forged = jwt.encode({'user_id': user.id}, self.private_keys['k2'], algorithm='EdDSA', headers={'kid': 'k3'})
+        with self.assertRaises(ValueError):
+            JWTManager.decode_token(forged)
+
+    def test_unusable_key_fails_on_load(self):
+        from pathlib import Path
+        from cryptography.hazmat.primitives import serialization
+        from django.core.exceptions import ImproperlyConfigured
+        from .keys import KeyRing
+
+        # ключ Ed25519 не подходит для RS256
+        with self.assertRaisesMessage(ImproperlyConfigured, 'k1.pem'):
+            KeyRing(self.keys_dir, 'RS256').load()
+
+        # зашифрованный PEM не загружается без пароля
+        Path(self.keys_dir, 'k2.pem').write_bytes(self.private_keys['k2'].private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.BestAvailableEncryption(b'secret'),
+        ))
+        with self.assertRaisesMessage(ImproperlyConfigured, 'k2.pem'):
+            KeyRing(self.keys_dir, 'EdDSA').load()
+
+    def test_jwks(self):
+        from .keys import KeyRing
+
+        self.use_ring(KeyRing(self.keys_dir, 'EdDSA'))
+        self.retire('k1')
+        response = self.client.get('/api/auth/.well-known/jwks.json')
+        self.assertEqual(response.status_code, 200)
+        keys = {key['kid']: key for key in response.json()['keys']}
+        self.assertEqual(set(keys), {'k1', 'k2'})
+        self.assertEqual(keys['k1']['alg'], 'EdDSA')
+        self.assertEqual(keys['k1']['kty'], 'OKP')
+        self.assertNotIn('d', keys['k2'])
+
+
+class TokenUserCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        from .cache import TokenUserCache
+
+        self.now = 1000.0
+        patcher = mock.patch('auth_app.cache.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TokenUserCache(max_size=2, ttl=60)
+
+    def test_lru_eviction(self):
+        self.cache.set(1, 10, 'first')
+        self.cache.set(2, 10, 'second')
+        self.assertEqual(self.cache.get(1, 10), 'first')
+        # вытесняется давно не читавшаяся запись
+        self.cache.set(3, 10, 'third')
+        self.assertIsNone(self.cache.get(2, 10))
+        self.assertEqual(self.cache.get(1, 10), 'first')
+        self.assertEqual(self.cache.get(3, 10), 'third')
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+    def test_ttl_is_capped_by_token_lifetime(self):
+        self.cache.set(1, 10, 'user', ttl=5)
+        self.cache.set(2, 10, 'user', ttl=600)
+        self.now += 6
+        self.assertIsNone(self.cache.get(1, 10))
+        self.assertEqual(self.cache.get(2, 10), 'user')
+        self.now += 60
+        self.assertIsNone(self.cache.get(2, 10))
+        self.cache.set(3, 10, 'user', ttl=0)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_hit_miss_counters(self):
+        self.cache.get(1, 10)
+        self.cache.set(1, 10, 'user')
+        self.cache.get(1, 10)
+        self.cache.get(1, 10)
+        # другой iat - другой токен
+        self.cache.get(1, 11)
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 2, 'size': 1, 'max_size': 2})
+
+    def test_invalidate_drops_every_token_of_user(self):
+        self.cache.set(1, 10, 'old')
+        self.cache.set(1, 11, 'new')
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1, 10))
+        self.assertIsNone(self.cache.get(1, 11))
+
+
+class TokenUserCacheInvalidationTests(TestCase):
+    # изменения пользователя сбрасывают кэш после коммита
+
+    def setUp(self):
+        from .cache import user_cache
+        from .revocation import revocation_store
+
+        self.user_cache = user_cache
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.addCleanup(revocation_store.clear)
+        self.user = make_user('user')
+        # токен, выданный до изменения прав: пользователь берётся из кэша или БД
+        payload = JWTManager.decode_token(JWTManager.create_token(self.user))
+        self.token = JWTManager.encode(payload | {'pmv': None})
+        self.iat = payload['iat']
+
+    def cached(self):
+        return self.user_cache.get(self.user.id, self.iat)
+
+    def test_second_lookup_uses_cache(self):
+        JWTManager.get_user_from_token(self.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(JWTManager.get_user_from_token(self.token), self.user)
+        self.assertEqual(self.user_cache.stats()['hits'], 1)
+
+    def test_soft_delete_and_restore(self):
+        profile = self.user.profile
+        JWTManager.get_user_from_token(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.soft_delete()
+        self.assertIsNone(self.cached())
+        self.assertIsNone(JWTManager.get_user_from_token(self.token))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.restore()
+        self.assertIsNone(self.cached())
+        # токены, выданные до удаления, отозваны
+        self.assertIsNone(JWTManager.get_user_from_token(self.token))
+        self.assertEqual(JWTManager.get_user_from_token(JWTManager.create_token(self.user)), self.user)
+
+    def test_profile_update(self):
+        from .serializers import UpdateProfileSerializer
+
+        JWTManager.get_user_from_token(self.token)
+        self.assertIsNotNone(self.cached())
+        serializer = UpdateProfileSerializer(self.user.profile, data={'first_name': 'Иван'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(JWTManager.get_user_from_token(self.token).first_name, 'Иван')
+
+
+class PermissionEngineTests(TestCase):
+
+    def setUp(self):
+        self.manager = Role.objects.create(name='manager')
+        self.users = BusinessElement.objects.create(name='users')
+        self.orders = BusinessElement.objects.create(name='orders')
+        AccessRule.objects.create(role=self.manager, element=self.users, can_read=True, can_read_all=True)
+        AccessRule.objects.create(role=self.manager, element=self.orders, can_update=True)
+        self.user = make_user('manager', role=self.manager)
+        permission_engine.invalidate()
+
+    def test_check(self):
+        self.assertTrue(permission_engine.check(self.user, 'users', 'read'))
+        self.assertFalse(permission_engine.check(self.user, 'users', 'create'))
+        # своё - по own-флагу, чужое и коллекция - только по *_all
+        self.assertTrue(permission_engine.check(self.user, 'orders', 'update', owner_id=self.user.id))
+        self.assertFalse(permission_engine.check(self.user, 'orders', 'update', owner_id=0))
+        self.assertFalse(permission_engine.check(self.user, 'orders', 'update'))
+        self.assertTrue(permission_engine.has_any(self.user, 'orders', 'update'))
+        self.assertTrue(permission_engine.has_role(self.user, 'manager'))
+
+    def test_change_rebuilds_after_commit(self):
+        self.assertFalse(permission_engine.check(self.user, 'orders', 'read'))
+        with self.captureOnCommitCallbacks(execute=True):
+            AccessRule.objects.filter(role=self.manager, element=self.orders).update(can_read_all=True)
+            AccessRule.objects.get(role=self.manager, element=self.orders).save()
+        self.assertTrue(permission_engine.check(self.user, 'orders', 'read'))
+
+    def test_change_in_other_process_rebuilds_matrix(self):
+        # два движка с общим кэшем - как два воркера
+        from .permissions import PermissionEngine
+
+        engine = PermissionEngine(check_interval=0)
+        other = PermissionEngine(check_interval=0)
+        self.assertTrue(engine.check(self.user, 'users', 'read'))
+        other.rebuild()
+
+        AccessRule.objects.filter(role=self.manager, element=self.users).delete()
+        other.invalidate()
+        self.assertFalse(engine.check(self.user, 'users', 'read'))
+        self.assertEqual(engine.version, other.version)
+
+
+class HashingPoolTests(TestCase):
+
+    def test_hash_and_check_in_pool(self):
+        import asyncio
+
+        service = hashing.PasswordHashingService(max_workers=2, queue_limit=2)
+        self.addCleanup(service.shutdown)
+        hashed = service.hash_password('secret-123')
+        self.assertEqual(service.verify_password('secret-123', hashed), (True, False))
+        self.assertEqual(service.verify_password('wrong', hashed), (False, False))
+        self.assertEqual(asyncio.run(service.averify_password('secret-123', hashed)), (True, False))
+
+    def test_saturated_pool_returns_503(self):
+        service = hashing.PasswordHashingService(max_workers=1, queue_limit=0, retry_after=3)
+        self.addCleanup(service.shutdown)
+        # единственный слот занят - как при полной очереди
+        service._slots.acquire()
+        with mock.patch('auth_app.utils.password_service', service):
+            response = self.client.post('/api/auth/register/', {
+                'username': 'user', 'email': 'user@example.com', 'first_name': 'Иван', 'last_name': 'Петров',
+                'password': 'Secret-12345', 'password2': 'Secret-12345',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertFalse(User.objects.exists())
+
+        service._slots.release()
+        self.assertTrue(service.hash_password('secret-123'))
+
+
+@override_settings(LOGIN_THROTTLE_ENABLED=False)
+@skipUnless(adrf, 'нужен пакет adrf')
+class AsyncViewTests(TestCase):
+    # async-view и async-ветка JWTAuthenticationMiddleware через AsyncClient
+
+    def setUp(self):
+        import importlib
+        from django.urls import clear_url_caches
+        from auth_system import urls as project_urls
+        from . import urls
+
+        def reload_urls():
+            # набор view выбирается при импорте urls.py
+            importlib.reload(urls)
+            importlib.reload(project_urls)
+            clear_url_caches()
+
+        with override_settings(AUTH_ASYNC_VIEWS=True):
+            reload_urls()
+        self.addCleanup(reload_urls)
+        self.user = make_user('user', password=hashing.hash_password('secret-123'), first_name='Иван')
+        # create_token читает роли из БД - в async-тесте это нужно делать заранее
+        self.token = JWTManager.create_token(self.user)
+
+    def auth(self, token=None):
+        # AsyncClient передаёт заголовки через headers=, а не HTTP_*
+        return {'headers': {'Authorization': f'Bearer {token or self.token}'}}
+
+    def test_views_are_async_and_non_atomic(self):
+        from django.urls import resolve
+
+        for path in ('/api/auth/login/', '/api/auth/profile/', '/api/auth/mock/users/'):
+            with self.subTest(path=path):
+                view = resolve(path).func
+                self.assertTrue(view.view_class.view_is_async)
+                self.assertIn('default', view._non_atomic_requests)
+
+    async def test_login(self):
+        response = await self.async_client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'secret-123'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(JWTManager.decode_token(response.json()['token'])['user_id'], self.user.id)
+
+        response = await self.async_client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'wrong'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_profile(self):
+        response = await self.async_client.get('/api/auth/profile/', **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['first_name'], 'Иван')
+
+    async def test_profile_not_modified(self):
+        auth = self.auth()
+        etag = (await self.async_client.get('/api/auth/profile/', **auth))['ETag']
+        auth['headers']['If-None-Match'] = etag
+        response = await self.async_client.get('/api/auth/profile/', **auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_middleware_rejects_missing_and_bad_tokens(self):
+        response = await self.async_client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/auth/profile/', **self.auth('broken'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'Неверный или просроченный токен')
+
+
+class PublicURLMatcherTests(SimpleTestCase):
+
+    def matcher(self, patterns, urlpatterns=None):
+        from .public_urls import PublicURLMatcher
+
+        if urlpatterns is None:
+            return PublicURLMatcher(patterns, include_views=False)
+        # URLconf - любой объект с urlpatterns
+        return PublicURLMatcher(patterns, urlconf=type('URLConf', (), {'urlpatterns': urlpatterns}))
+
+    def test_combined_pattern(self):
+        from django.conf import settings
+
+        matcher = self.matcher(settings.AUTH_PUBLIC_URLS + [r'^/api/auth/users/(?P<pk>\d+)/avatar/$'])
+        for path in ('/api/auth/register/', '/api/auth/login/', '/admin/auth/user/', '/api/auth/users/7/avatar/'):
+            self.assertTrue(matcher.match(path), path)
+        for path in ('/api/auth/profile/', '/api/auth/login/extra/', '/api/auth/users/me/avatar/', '/'):
+            self.assertFalse(matcher.match(path), path)
+        self.assertFalse(self.matcher([]).match('/api/auth/login/'))
+
+    def test_backreferences(self):
+        matcher = self.matcher([r'^/api/auth/login/$', r'^/files/(?P<name>\w+)/(?P=name)/$', r'^/mirror/(\d+)-\1/$'])
+        self.assertTrue(matcher.match('/files/report/report/'))
+        self.assertFalse(matcher.match('/files/report/other/'))
+        self.assertTrue(matcher.match('/mirror/12-12/'))
+        self.assertFalse(matcher.match('/mirror/12-13/'))
+        self.assertTrue(matcher.match('/api/auth/login/'))
+
+    def test_public_view_decorator(self):
+        from django.http import HttpResponse
+        from django.urls import include, path
+        from django.views import View
+        from .public_urls import public_view
+
+        def private(request):
+            return HttpResponse()
+
+        def health(request):
+            return HttpResponse()
+
+        @public_view
+        class Status(View):
+            pass
+
+        matcher = self.matcher([r'^/admin/'], [
+            path('api/', include([
+                path('status/<int:pk>/', Status.as_view()),
+                path('health/', public_view(health)),
+                path('private/', private),
+            ])),
+        ])
+        self.assertTrue(matcher.match('/api/status/3/'))
+        self.assertTrue(matcher.match('/api/health/'))
+        self.assertTrue(matcher.match('/admin/'))
+        self.assertFalse(matcher.match('/api/status/x/'))
+        self.assertFalse(matcher.match('/api/private/'))
+
+
+class PublicURLMiddlewareTests(TestCase):
+
+    def test_public_and_protected_paths(self):
+        # публичный путь доходит до view (405 на GET), защищённый требует токен
+        self.assertEqual(self.client.get('/api/auth/login/').status_code, 405)
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'Требуется аутентификация')
+
+
+@override_settings(LOGIN_THROTTLE_ENABLED=False)
+class TokenRevocationTests(TestCase):
+    # отозванный токен отклоняется, новый вход работает
+
+    def setUp(self):
+        from .revocation import revocation_store
+
+        revocation_store.clear()
+        self.addCleanup(revocation_store.clear)
+        self.user = make_user('user', password=hashing.hash_password('secret-123'))
+
+    def login(self, password='secret-123'):
+        return self.client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': password},
+            content_type='application/json',
+        )
+
+    def profile(self, token):
+        return self.client.get('/api/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_logout(self):
+        token = self.login().json()['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/logout/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profile(token).status_code, 401)
+        self.assertEqual(self.profile(self.login().json()['token']).status_code, 200)
+
+    def test_change_password(self):
+        old_token = JWTManager.create_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/auth/change-password/',
+                {'old_password': 'secret-123', 'new_password': 'N3w-passw0rd', 'new_password2': 'N3w-passw0rd'},
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {old_token}',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profile(old_token).status_code, 401)
+        self.assertEqual(self.profile(response.json()['token']).status_code, 200)
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(self.profile(self.login('N3w-passw0rd').json()['token']).status_code, 200)
+
+    def test_soft_delete(self):
+        token = JWTManager.create_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.soft_delete()
+        self.assertEqual(self.profile(token).status_code, 401)
+
+
+class RevocationStoreTests(TestCase):
+    # локальный денайлист: синхронизация с БД и очистка истёкших записей
+
+    def setUp(self):
+        from .revocation import RevocationStore
+
+        self.store = RevocationStore(sync_interval=0)
+        self.user = make_user('user')
+
+    def payload(self, **fields):
+        return JWTManager.decode_token(JWTManager.create_token(self.user)) | fields
+
+    def test_sync_picks_up_other_processes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import RevokedToken
+
+        payload = self.payload()
+        self.assertFalse(self.store.is_revoked(payload))
+        # записи, сделанные другим процессом, видны после синхронизации
+        RevokedToken.objects.create(jti=payload['jti'], expires_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(self.store.is_revoked(payload))
+        self.assertFalse(self.store.is_revoked(self.payload()))
+
+        RevokedToken.objects.create(user=self.user, expires_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(self.store.is_revoked(self.payload(iat=payload['iat'])))
+        self.assertEqual(self.store.stats(), {'tokens': 1, 'users': 1})
+
+    def test_expired_entries_are_dropped(self):
+        import time
+
+        payload = self.payload()
+        self.store._add(payload['jti'], None, time.time(), time.time() - 1)
+        self.store._add(None, self.user.id, time.time(), time.time() + 60)
+        self.store.refresh()
+        self.assertEqual(self.store.stats(), {'tokens': 0, 'users': 1})
+
+    def test_purge_command(self):
+        import io
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import RevokedToken
+
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='new', expires_at=now + timedelta(hours=1))
+        call_command('purge_revoked_tokens', stdout=io.StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['new'])
+
+class AdminListQueryCountTests(TestCase):
+    # число запросов админских списков не зависит от количества строк
+
+    def setUp(self):
+        self.admin_role = Role.objects.create(name='admin')
+        self.other_role = Role.objects.create(name='user')
+        admin = make_user('admin', role=self.admin_role)
+        self.add_rows(3)
+        permission_engine.invalidate()
+        self.auth = auth_header(admin)
+
+    def add_rows(self, count):
+        # правила без флагов не меняют матрицу прав, поэтому токен остаётся актуальным
+        start = BusinessElement.objects.count()
+        for i in range(start, start + count):
+            element = BusinessElement.objects.create(name=f'element-{i}')
+            Role.objects.create(name=f'role-{i}')
+            AccessRule.objects.create(role=self.other_role, element=element)
+
+    def count_queries(self, url):
+        self.client.get(url, **self.auth)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        small = self.count_queries(url)
+        self.add_rows(40)
+        self.assertEqual(self.count_queries(url), small)
+
+    def test_access_rule_list(self):
+        self.assert_constant_queries('/api/auth/access-rules/')
+
+    def test_role_list(self):
+        self.assert_constant_queries('/api/auth/roles/')
+
+    def test_element_list(self):
+        self.assert_constant_queries('/api/auth/elements/')
+
+    def test_access_rule_list_is_paginated(self):
+        response = self.client.get('/api/auth/access-rules/?page_size=2', **self.auth)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
+
+
+class AccessRuleImportExportTests(TestCase):
+
+    def setUp(self):
+        self.manager = Role.objects.create(name='manager')
+        Role.objects.create(name='auditor')
+        self.users = BusinessElement.objects.create(name='users')
+        BusinessElement.objects.create(name='orders')
+        AccessRule.objects.create(role=self.manager, element=self.users, can_read=True, can_update=True)
+
+    def rules(self):
+        from .bulk import FLAG_NAMES
+        return sorted(AccessRule.objects.values_list('role__name', 'element__name', *FLAG_NAMES))
+
+    def test_round_trip(self):
+        import io
+        import tempfile
+        from django.core.management import call_command
+
+        expected = self.rules()
+        for fmt in ('jsonl', 'csv'):
+            with self.subTest(fmt=fmt):
+                output = io.StringIO()
+                call_command('export_access_rules', '--format', fmt, stdout=output)
+                AccessRule.objects.all().delete()
+                with tempfile.NamedTemporaryFile('w', suffix=f'.{fmt}', encoding='utf-8', newline='') as file:
+                    file.write(output.getvalue())
+                    file.flush()
+                    call_command('import_access_rules', file.name, stdout=io.StringIO())
+                self.assertEqual(self.rules(), expected)
+
+    def test_import_upserts(self):
+        import io
+        from . import bulk
+
+        data = (
+            'role,element,can_read,can_read_all,can_create,can_update,can_update_all,can_delete,can_delete_all\n'
+            'manager,users,1,1,0,0,0,0,0\n'
+            'auditor,orders,yes,no,,,,,\n'
+        )
+        self.assertEqual(bulk.import_access_rules(io.StringIO(data), 'csv'), 2)
+        self.assertEqual(AccessRule.objects.count(), 2)
+        rule = AccessRule.objects.get(role=self.manager, element=self.users)
+        self.assertTrue(rule.can_read_all)
+        self.assertFalse(rule.can_update)
+
+    def test_bad_rows_roll_back_everything(self):
+        import io
+        from . import bulk
+
+        before = self.rules()
+        lines = io.StringIO(
+            '{"role": "auditor", "element": "users", "can_read": true}\n'
+            '{"role": "missing", "element": "users"}\n'
+            'not json\n'
+            '{"role": "auditor", "element": "orders", "can_read": "maybe"}\n'
+        )
+        with self.assertRaises(bulk.BulkImportError) as context:
+            # первая пачка корректна и успевает записаться до ошибок
+            bulk.import_access_rules(lines, 'jsonl', batch_size=1)
+        self.assertEqual([error['line'] for error in context.exception.errors], [2, 3, 4])
+        self.assertEqual(self.rules(), before)
+
+    def test_csv_columns_must_match(self):
+        import io
+        from . import bulk
+
+        before = self.rules()
+        for header, error in (
+            ('role,element,can_read', 'Нет колонок: can_read_all'),
+            ('role,element,can_read,can_read_al,can_create,can_update,can_update_all,can_delete,can_delete_all',
+             'Неизвестные колонки: can_read_al'),
+        ):
+            with self.subTest(header=header):
+                with self.assertRaises(bulk.BulkImportError) as context:
+                    bulk.import_access_rules(io.StringIO(header + '\nmanager,users,1\n'), 'csv')
+                self.assertTrue(context.exception.errors[0]['error'].startswith(error))
+                self.assertEqual(self.rules(), before)
+
+    def test_jsonl_unknown_field(self):
+        import io
+        from . import bulk
+
+        with self.assertRaises(bulk.BulkImportError) as context:
+            bulk.import_access_rules(io.StringIO('{"role": "manager", "element": "users", "can_raed": true}\n'))
+        self.assertEqual(context.exception.errors, [{'line': 1, 'error': 'Неизвестные поля: can_raed'}])
+
+
+class FakePool:
+    # пул процессов, выполняющий задачи в текущем процессе (внутри транзакции теста)
+
+    def __init__(self, workers):
+        self.workers = workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def imap_unordered(self, fn, items):
+        return map(fn, items)
+
+
+class SeedDataTests(TestCase):
+
+    def run_command(self, workers, users=40):
+        import io
+        from django.core.management import call_command
+
+        context = mock.Mock(Pool=FakePool)
+        with mock.patch('auth_app.management.commands.seed_data.multiprocessing.get_context', return_value=context), \
+                mock.patch('auth_app.management.commands.seed_data.connections'):
+            call_command('seed_data', users=users, roles=5, elements=2, seed=7, batch_size=7,
+                         workers=workers, stdout=io.StringIO())
+        return dict(UserProfile.objects.filter(user__username__startswith='load-7-')
+                    .values_list('user__username', 'role__name'))
+
+    def generate(self, workers):
+        data = self.run_command(workers)
+        User.objects.filter(username__startswith='load-7-').delete()
+        return data
+
+    def test_same_seed_same_users_for_any_worker_count(self):
+        single = self.generate(workers=1)
+        self.assertEqual(len(single), 40)
+        self.assertGreater(len(set(single.values())), 1)
+        self.assertEqual(self.generate(workers=4), single)
+        self.assertEqual(self.generate(workers=3), single)
+
+    def test_rerun_with_same_seed(self):
+        # повторный запуск не падает на уникальности username и досоздаёт недостающих
+        first = self.run_command(workers=1, users=30)
+        self.assertEqual(len(first), 30)
+        second = self.run_command(workers=3)
+        self.assertEqual(len(second), 40)
+        self.assertEqual({name: role for name, role in second.items() if name in first}, first)
+
+
+@override_settings(AUTH_INSTRUMENTATION=True, AUTH_METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('user')
+        self.staff = make_user('staff', is_staff=True)
+
+    def test_phase_timer(self):
+        from .instrumentation import RequestTimings, current_timings, phase
+
+        with phase('token_decode'):
+            pass
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with phase('token_decode'):
+                pass
+            with phase('token_decode'):
+                pass
+        finally:
+            current_timings.reset(token)
+        self.assertEqual(list(timings.phases), ['token_decode'])
+        self.assertIn('token_decode;dur=', timings.server_timing(0.01))
+
+    def test_server_timing_header(self):
+        admin = make_user('admin', role=Role.objects.create(name='admin'))
+        permission_engine.invalidate()
+        response = self.client.get('/api/auth/roles/', **auth_header(admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('permission_check;dur=', response['Server-Timing'])
+        self.assertIn('db;desc=', response['Server-Timing'])
+
+    def test_metrics_access(self):
+        from django.test import RequestFactory
+        from .instrumentation import metrics_view
+
+        factory = RequestFactory()
+        self.assertEqual(metrics_view(factory.get('/metrics', REMOTE_ADDR='192.0.2.1')).status_code, 403)
+        # X-Forwarded-For не даёт доступа
+        request = factory.get('/metrics', REMOTE_ADDR='192.0.2.1', HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(metrics_view(request).status_code, 403)
+        request = factory.get('/metrics', REMOTE_ADDR='192.0.2.1', **auth_header(self.user))
+        self.assertEqual(metrics_view(request).status_code, 403)
+
+        request = factory.get('/metrics', REMOTE_ADDR='192.0.2.1', **auth_header(self.staff))
+        self.assertEqual(metrics_view(request).status_code, 200)
+        response = metrics_view(factory.get('/metrics', REMOTE_ADDR='10.1.2.3'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'auth_request_phase_seconds', response.content)
+
+    def test_label_values_are_escaped(self):
+        from .metrics import format_labels
+
+        self.assertEqual(format_labels(('path',), ('a"b\\c\nd',)), '{path="a\\"b\\\\c\\nd"}')
+
+    @skipIf(settings.AUTH_INSTRUMENTATION, 'инструментирование включено в окружении')
+    def test_metrics_not_mounted_by_default(self):
+        from django.urls import NoReverseMatch, reverse
+
+        with self.assertRaises(NoReverseMatch):
+            reverse('metrics')
+
+
+class PasswordRehashTests(TestCase):
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        import bcrypt
+        from django.contrib.auth.hashers import identify_hasher
+
+        legacy = bcrypt.hashpw(b'secret-123', bcrypt.gensalt(rounds=4)).decode()
+        user = make_user('user', password=legacy)
+
+        with self.assertRaises(serializers.ValidationError):
+            LoginSerializer.authenticate('user@example.com', 'wrong')
+        user.refresh_from_db()
+        self.assertEqual(user.password, legacy)
+
+        LoginSerializer.authenticate('user@example.com', 'secret-123')
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, settings.PASSWORD_HASH_ALGORITHM)
+        self.assertEqual(hashing.verify_password('secret-123', user.password), (True, False))
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LoginThrottleTests(SimpleTestCase):
+    # корзины и блокировка на подставном времени
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = LoginLimiter(
+            MemoryBackend(), ip_rate=60, ip_burst=10, email_rate=6, email_burst=3,
+            lockout_threshold=2, lockout_base=30, lockout_max=100, clock=self.clock,
+        )
+
+    def test_email_bucket_refills(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.check('10.0.0.1', 'User@Example.com'), 0)
+        self.assertAlmostEqual(self.limiter.check('10.0.0.2', 'user@example.com'), 10)
+        self.clock.now += 10
+        self.assertEqual(self.limiter.check('10.0.0.3', 'user@example.com'), 0)
+
+    def test_ip_bucket_is_shared_across_emails(self):
+        for i in range(10):
+            self.assertEqual(self.limiter.check('10.0.0.1', f'user{i}@example.com'), 0)
+        self.assertGreater(self.limiter.check('10.0.0.1', 'other@example.com'), 0)
+
+    def test_lockout_grows_exponentially(self):
+        email = 'user@example.com'
+        self.limiter.register_failure(email)
+        self.limiter.register_failure(email)
+        self.assertEqual(self.limiter.check('10.0.0.1', email), 30)
+        self.limiter.register_failure(email)
+        self.assertEqual(self.limiter.check('10.0.0.1', email), 60)
+        self.limiter.register_failure(email)
+        self.assertEqual(self.limiter.check('10.0.0.1', email), 100)
+
+    def test_success_resets_lockout(self):
+        email = 'user@example.com'
+        self.limiter.register_failure(email)
+        self.limiter.register_success(email)
+        self.limiter.register_failure(email)
+        self.assertEqual(self.limiter.check('10.0.0.1', email), 0)
+
+
+class LoginThrottleViewTests(TestCase):
+
+    def test_throttled_login_skips_authentication(self):
+        limiter = LoginLimiter(
+            MemoryBackend(), ip_rate=1, ip_burst=1, email_rate=1, email_burst=1,
+            lockout_threshold=5, lockout_base=30, lockout_max=100,
+        )
+        limiter.check('127.0.0.1', None)
+        with mock.patch('auth_app.throttling.login_limiter', limiter), \
+                mock.patch('auth_app.serializers.LoginSerializer.authenticate') as authenticate:
+            response = self.client.post(
+                '/api/auth/login/', {'email': 'user@example.com', 'password': 'secret'},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+
+
+class LoginLookupTests(TestCase):
+
+    def setUp(self):
+        role = Role.objects.create(name='user')
+        user = User.objects.create_user(username='user', email='User@Example.com', password='secret-123')
+        UserProfile.objects.create(user=user, role=role)
+
+    def test_login_is_single_query_and_case_insensitive(self):
+        with self.assertNumQueries(1):
+            user = LoginSerializer.authenticate('user@example.com', 'secret-123')
+            self.assertEqual(user.profile.role.name, 'user')
+
+    def test_unknown_email_still_verifies_password(self):
+        with mock.patch('auth_app.hashing.dummy_hash', wraps=hashing.dummy_hash) as dummy:
+            with self.assertRaises(serializers.ValidationError):
+                LoginSerializer.authenticate('missing@example.com', 'secret-123')
+        dummy.assert_called_once()
+
+
+class ProfileSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('user', role=Role.objects.create(name='user'))
+        self.auth = auth_header(self.user)
+
+    def test_etag_revalidation_skips_database(self):
+        etag = self.client.get('/api/auth/profile/', **self.auth)['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in context.captured_queries if 'auth_app_userprofile' in q['sql']])
+
+    def test_update_changes_etag(self):
+        etag = self.client.get('/api/auth/profile/', **self.auth)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/api/auth/profile/', {'middle_name': 'Иванович'},
+                            content_type='application/json', **self.auth)
+        response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['middle_name'], 'Иванович')
+
+    def assert_etag_changes(self, edit):
+        # смена роли отзывает выданные токены - на каждый запрос свежий токен
+        etag = self.client.get('/api/auth/profile/', **auth_header(self.user))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            edit()
+        response = self.client.get('/api/auth/profile/', HTTP_IF_NONE_MATCH=etag, **auth_header(self.user))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orm_edits_change_etag(self):
+        # правки мимо API: админка, shell
+        profile = UserProfile.objects.select_related('user').get(user__email='user@example.com')
+        manager = Role.objects.create(name='manager')
+
+        profile.role = manager
+        self.assertEqual(self.assert_etag_changes(profile.save)['role_name'], 'manager')
+        profile.user.first_name = 'Пётр'
+        self.assertEqual(self.assert_etag_changes(profile.user.save)['user']['first_name'], 'Пётр')
+        manager.name = 'lead'
+        self.assertEqual(self.assert_etag_changes(manager.save)['role_name'], 'lead')
+
+    def test_unchanged_update_writes_nothing(self):
+        data = {'email': 'user@example.com'}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put('/api/auth/profile/', data, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if q['sql'].startswith('UPDATE')])
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_matches_drf_renderer(self):
+        import datetime
+        import decimal
+        import io
+        import uuid
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONParser, FastJSONRenderer
+
+        data = {
+            'created_at': datetime.datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'local': datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=3))),
+            'naive': datetime.datetime(2026, 1, 2, 3, 4, 5),
+            'date': datetime.date(2026, 10, 18),
+            'time': datetime.time(9, 15, 0, 500000),
+            'price': decimal.Decimal('12.50'),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'name': 'Иванов Пётр — «тест» ✓',
+            'separators': 'a\u2028b\u2029c',
+            'items': [1, 2.5, None, True],
+            7: 'ключ-число',
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        # с отступами - через стандартный рендерер
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(expected))['name'], data['name'])
+
+
+class FastSerializerTests(TestCase):
+
+    def test_profile_matches_model_serializer(self):
+        from .serializers import UserProfileSerializer, fast_profile_serializer
+
+        role = Role.objects.create(name='user')
+        user = User.objects.create(username='user', email='user@example.com', first_name='Иван')
+        profile = UserProfile.objects.create(user=user, role=role, middle_name='Петрович')
+        profile.soft_delete()
+        profile = UserProfile.all_objects.select_related('user', 'role').get(pk=profile.pk)
+        self.assertEqual(fast_profile_serializer.to_representation(profile), UserProfileSerializer(profile).data)
+
+
+class PermissionBatchTests(TestCase):
+
+    def setUp(self):
+        role = Role.objects.create(name='manager')
+        users = BusinessElement.objects.create(name='users')
+        orders = BusinessElement.objects.create(name='orders')
+        BusinessElement.objects.create(name='products')
+        AccessRule.objects.create(role=role, element=users, can_read=True, can_read_all=True)
+        AccessRule.objects.create(role=role, element=orders, can_read=True, can_update=True)
+        self.user = make_user('manager', role=role)
+        permission_engine.invalidate()
+        self.auth = auth_header(self.user)
+
+    def test_check(self):
+        checks = [
+            {'element': 'users', 'action': 'read'},
+            {'element': 'orders', 'action': 'read'},
+            {'element': 'orders', 'action': 'update', 'owner_id': self.user.id},
+            {'element': 'products', 'action': 'read'},
+            {'element': 'missing', 'action': 'delete'},
+        ]
+        response = self.client.post('/api/auth/permissions/check/', {'checks': checks},
+                                    content_type='application/json', **self.auth)
+        self.assertEqual(response.json()['results'], [True, False, True, False, False])
+
+    def test_me(self):
+        response = self.client.get('/api/auth/permissions/me/', **self.auth)
+        self.assertEqual(response.json()['permissions'], {
+            'users': {'read': 'all', 'create': None, 'update': None, 'delete': None},
+            'orders': {'read': 'own', 'create': None, 'update': 'own', 'delete': None},
+        })
+
+
+class MultiRolePermissionTests(TestCase):
+
+    def setUp(self):
+        self.base = Role.objects.create(name='employee')
+        self.manager = Role.objects.create(name='manager', parent=self.base)
+        self.auditor = Role.objects.create(name='auditor')
+        self.users = BusinessElement.objects.create(name='users')
+        self.orders = BusinessElement.objects.create(name='orders')
+        AccessRule.objects.create(role=self.base, element=self.users, can_read=True)
+        AccessRule.objects.create(role=self.manager, element=self.orders, can_update=True)
+        AccessRule.objects.create(role=self.auditor, element=self.orders, can_read_all=True)
+        user = make_user('user', role=self.manager)
+        user.profile.roles.add(self.auditor)
+        self.user = User.objects.select_related('profile').get(pk=user.pk)
+        permission_engine.invalidate()
+
+    def test_union_with_inherited_rules(self):
+        self.assertEqual(permission_engine.effective_permissions(self.user), {
+            'users': {'read': 'own', 'create': None, 'update': None, 'delete': None},
+            'orders': {'read': 'all', 'create': None, 'update': 'own', 'delete': None},
+        })
+
+    def test_incremental_update_matches_full_rebuild(self):
+        permission_engine.effective_permissions(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = AccessRule.objects.get(role=self.base, element=self.users)
+            rule.can_read_all = True
+            rule.save()
+            AccessRule.objects.filter(role=self.auditor).delete()
+        self.assertTrue(permission_engine.check(self.user, 'users', 'read'))
+        self.assertFalse(permission_engine.check(self.user, 'orders', 'read'))
+        version = permission_engine.version
+        permission_engine.rebuild()
+        self.assertEqual(permission_engine.version, version)
+
+
+class RoleChangeRevocationTests(TestCase):
+    # role_ids в access-токене: после смены ролей старый токен не должен действовать
+
+    def setUp(self):
+        from .revocation import revocation_store
+
+        self.addCleanup(revocation_store.clear)
+        self.role = Role.objects.create(name='user')
+        self.auditor = Role.objects.create(name='auditor')
+        self.user = make_user('user', role=self.role)
+        self.profile = UserProfile.objects.get(user=self.user)
+        self.auditor.extra_users.add(self.profile)
+        permission_engine.rebuild()
+
+    def assert_revoked_after(self, change):
+        token = JWTManager.create_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get('/api/auth/permissions/me/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_primary_role_change(self):
+        self.profile.role = self.auditor
+        self.assert_revoked_after(self.profile.save)
+
+    def test_extra_roles_change(self):
+        self.assert_revoked_after(lambda: self.profile.roles.remove(self.auditor))
+        self.assert_revoked_after(lambda: self.profile.roles.add(self.auditor))
+        self.assert_revoked_after(self.auditor.extra_users.clear)
+
+    def test_unrelated_save_keeps_token(self):
+        token = JWTManager.create_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.middle_name = 'Петрович'
+            self.profile.save()
+            self.profile.roles.add(self.auditor)
+        response = self.client.get('/api/auth/permissions/me/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+
+
+class PermissionMatrixTests(SimpleTestCase):
+
+    def test_update_rule_does_not_mutate_shared_dicts(self):
+        # читатели обходят by_role без блокировки - update_rule подменяет словари целиком
+        from .permissions import READ, READ_ALL, PermissionMatrix
+
+        matrix = PermissionMatrix({(1, 1): READ, (2, 1): READ_ALL}, {'users': 1, 'orders': 2}, {'a': 1, 'b': 2})
+        self.assertEqual(matrix.role_set_flags((1, 2)), {1: READ | READ_ALL})
+        rules, by_role, role_rules, role_sets = matrix.rules, matrix.by_role, matrix.by_role[1], matrix.role_sets
+
+        matrix.update_rule(1, 2, READ)
+        matrix.update_rule(2, 1, 0)
+        self.assertEqual(rules, {(1, 1): READ, (2, 1): READ_ALL})
+        self.assertEqual(by_role, {1: {1: READ}, 2: {1: READ_ALL}})
+        self.assertEqual(role_rules, {1: READ})
+        self.assertEqual(role_sets, {(1, 2): (frozenset({1, 2}), {1: READ | READ_ALL})})
+
+        self.assertEqual(matrix.by_role, {1: {1: READ, 2: READ}})
+        self.assertEqual(matrix.role_set_flags((1, 2)), {1: READ, 2: READ})
+        rebuilt = PermissionMatrix(dict(matrix.rules), matrix.element_ids, matrix.role_ids)
+        self.assertEqual(rebuilt.version, matrix.version)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # replica - тестовое зеркало default. TransactionTestCase: внутри транзакции
+    # TestCase роутер всегда выбирает default, реплика не проверялась бы вовсе
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        admin_role = Role.objects.create(name='admin')
+        admin = make_user('admin', role=admin_role)
+        permission_engine.rebuild()
+        self.auth = auth_header(admin)
+
+    def role_queries(self, alias, method, url, **extra):
+        with CaptureQueriesContext(connections[alias]) as context:
+            response = getattr(self.client, method)(url, content_type='application/json', **self.auth, **extra)
+        self.assertLess(response.status_code, 400)
+        return [q for q in context.captured_queries if 'auth_app_role' in q['sql']]
+
+    def test_router(self):
+        self.assertEqual(router.db_for_read(Role), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Role), 'replica')
+            self.assertEqual(router.db_for_write(Role), 'default')
+
+    def test_reads_inside_transaction_use_primary(self):
+        with replica_reads():
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Role), 'default')
+                with CaptureQueriesContext(connections['replica']) as context:
+                    list(Role.objects.all())
+                self.assertEqual(context.captured_queries, [])
+            self.assertEqual(router.db_for_read(Role), 'replica')
+
+    def test_admin_list_reads_from_replica(self):
+        self.assertTrue(self.role_queries('replica', 'get', '/api/auth/roles/'))
+
+    def test_write_pins_user_to_primary(self):
+        self.role_queries('default', 'post', '/api/auth/roles/', data={'name': 'manager'})
+        self.assertFalse(self.role_queries('replica', 'get', '/api/auth/roles/'))
+        self.assertTrue(self.role_queries('default', 'get', '/api/auth/roles/'))
+
+    def test_token_user_lookup_respects_pin(self):
+        from .cache import user_cache
+        from .db import pin_primary
+
+        user = make_user('user')
+        # токен с устаревшим pmv: пользователь загружается из БД
+        payload = JWTManager.decode_token(JWTManager.create_token(user))
+        token = JWTManager.encode(payload | {'pmv': None})
+        self.addCleanup(user_cache.clear)
+        for alias in ('replica', 'default'):
+            with self.subTest(alias=alias):
+                user_cache.clear()
+                if alias == 'default':
+                    pin_primary(user.id)
+                with CaptureQueriesContext(connections[alias]) as context:
+                    self.assertEqual(JWTManager.get_user_from_token(token), user)
+                self.assertTrue([q for q in context.captured_queries if 'auth_user' in q['sql']])
+
+
+class LoginActivityBufferTests(TestCase):
+
+    def test_flush_writes_batch(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .activity import LoginActivityBuffer
+
+        users = [make_user(f'user{i}') for i in range(2)]
+        buffer = LoginActivityBuffer(flush_interval_ms=0, flush_size=100)
+        now = timezone.now()
+        buffer.add(users[0].id, now - timedelta(minutes=1), '10.0.0.1')
+        buffer.add(users[0].id, now, None)
+        buffer.add(users[1].id, now, '10.0.0.2')
+        self.assertEqual(len(buffer), 2)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(buffer.flush(), 2)
+        updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(len(buffer), 0)
+        profile = UserProfile.objects.select_related('user').get(user=users[0])
+        self.assertEqual(profile.login_count, 2)
+        self.assertEqual(profile.last_login_ip, '10.0.0.1')
+        self.assertEqual(profile.user.last_login, now)
+
+    def test_full_buffer_flushes_synchronously(self):
+        from django.utils import timezone
+        from .activity import LoginActivityBuffer
+
+        users = [make_user(f'user{i}') for i in range(3)]
+        buffer = LoginActivityBuffer(flush_interval_ms=60000, flush_size=100, max_size=2)
+        with mock.patch.object(buffer, '_ensure_thread'):
+            for user in users:
+                buffer.add(user.id, timezone.now())
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(UserProfile.objects.filter(login_count=1).count(), 2)
+
+    def test_full_buffer_drops_oldest_when_flush_fails(self):
+        from django.utils import timezone
+        from .activity import LoginActivityBuffer
+
+        buffer = LoginActivityBuffer(flush_interval_ms=0, flush_size=100, max_size=2)
+        with mock.patch.object(LoginActivityBuffer, 'write', side_effect=RuntimeError):
+            for user_id in (1, 2, 3):
+                buffer.add(user_id, timezone.now())
+        self.assertEqual(list(buffer._entries), [2, 3])
+
+
+class BulkLifecycleTests(TestCase):
+
+    def setUp(self):
+        self.admin_role = Role.objects.create(name='admin')
+        self.staff_role = Role.objects.create(name='staff')
+        self.users = [make_user(f'user{i}', email=f'user{i}@corp.example') for i in range(5)]
+        self.user_ids = [user.id for user in self.users]
+
+    def test_soft_delete_and_restore_in_chunks(self):
+        from . import lifecycle
+        from .models import RevokedToken
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(lifecycle.soft_delete_users(self.user_ids, chunk_size=2), 5)
+        # на пачку: профили, пользователи, refresh-токены - по одному UPDATE
+        updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3 * 3)
+        self.assertEqual(UserProfile.all_objects.filter(is_deleted=True).count(), 5)
+        self.assertFalse(User.objects.filter(id__in=self.user_ids, is_active=True).exists())
+        self.assertEqual(RevokedToken.objects.filter(user_id__in=self.user_ids).count(), 5)
+        # повторный вызов ничего не пишет
+        self.assertEqual(lifecycle.soft_delete_users(self.user_ids), 0)
+
+        self.assertEqual(lifecycle.restore_users(self.user_ids[:2]), 2)
+        self.assertEqual(UserProfile.objects.filter(is_deleted=False).count(), 2)
+
+    def test_bulk_endpoint_reassigns_role(self):
+        admin = make_user('admin', role=self.admin_role)
+        permission_engine.rebuild()
+        auth = auth_header(admin)
+
+        response = self.client.post('/api/auth/users/bulk/', {
+            'action': 'reassign_role', 'email_domain': 'corp.example', 'role': 'staff',
+        }, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changed'], 5)
+        self.assertEqual(UserProfile.objects.filter(role=self.staff_role).count(), 5)
+
+        response = self.client.post('/api/auth/users/bulk/', {'action': 'soft_delete'},
+                                    content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_reassign_role_revokes_access_tokens(self):
+        from . import lifecycle
+        from .revocation import revocation_store
+
+        self.addCleanup(revocation_store.clear)
+        admin = make_user('admin', role=self.admin_role)
+        permission_engine.rebuild()
+        auth = auth_header(admin)
+        self.assertEqual(self.client.get('/api/auth/roles/', **auth).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(lifecycle.reassign_role([admin.id], 'staff'), 1)
+        # токен с role_ids админа больше не действует
+        self.assertIn(self.client.get('/api/auth/roles/', **auth).status_code, (401, 403))
+
+    def test_default_manager_hides_deleted_and_purge(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import lifecycle
+
+        lifecycle.soft_delete_users(self.user_ids[:3])
+        self.assertEqual(UserProfile.objects.count(), 2)
+        self.assertEqual(UserProfile.all_objects.count(), 5)
+        # user.profile идёт через базовый менеджер
+        self.assertTrue(User.objects.get(id=self.user_ids[0]).profile.is_deleted)
+
+        UserProfile.all_objects.filter(user_id=self.user_ids[0]).update(
+            deleted_at=timezone.now() - timedelta(days=40),
+        )
+        purged = lifecycle.purge_deleted_users(timezone.now() - timedelta(days=30), batch_size=1)
+        self.assertEqual(purged, 1)
+        self.assertFalse(User.objects.filter(id=self.user_ids[0]).exists())
+        self.assertEqual(UserProfile.all_objects.count(), 4)
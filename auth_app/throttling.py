@@ -0,0 +1,217 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import registry
+
+# Ограничение попыток входа: token bucket на IP и на email + экспоненциальная
+# блокировка email после серии неудачных входов. Проверка выполняется до
+# LoginSerializer.validate, т.е. до запроса к БД и вычисления хэша пароля
+
+LOGIN_THROTTLED = registry.counter(
+    'auth_login_throttled_total', 'Отклонённые попытки входа', ['scope', 'reason'],
+)
+
+
+class LoginThrottled(Throttled):
+    default_detail = 'Слишком много попыток входа'
+    extra_detail_singular = 'Повторите через {wait} секунду.'
+    extra_detail_plural = 'Повторите через {wait} секунд.'
+
+
+class MemoryBackend:
+    # Состояние в памяти процесса: у каждого воркера свои счётчики.
+    # Число ключей ограничено, при переполнении вытесняются самые старые
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key, fn, ttl, now):
+        # атомарно: state = fn(state), возвращает результат fn
+        with self._lock:
+            entry = self._data.get(key)
+            state = entry[0] if entry is not None and entry[1] > now else None
+            state, result = fn(state)
+            if state is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = (state, now + ttl)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_keys:
+                    self._data.popitem(last=False)
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    # Общее состояние для всех воркеров (Redis или совместимый сервер, нужен пакет redis)
+
+    def __init__(self, url, prefix='login-throttle:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.watch_error = redis.WatchError
+
+    def update(self, key, fn, ttl, now):
+        key = self.prefix + key
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    state, result = fn(json.loads(raw) if raw else None)
+                    pipe.multi()
+                    if state is None:
+                        pipe.delete(key)
+                    else:
+                        pipe.set(key, json.dumps(state), ex=max(1, int(ttl)))
+                    pipe.execute()
+                    return result
+                except self.watch_error:
+                    # ключ изменил другой воркер - повтор
+                    continue
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class LoginLimiter:
+    # Состояние ключа: [токены, время пополнения, неудачные попытки подряд, заблокирован до]
+
+    def __init__(self, backend, ip_rate, ip_burst, email_rate, email_burst,
+                 lockout_threshold, lockout_base, lockout_max, clock=time.time):
+        # rate - попыток в минуту, burst - ёмкость корзины
+        self.backend = backend
+        self.scopes = {
+            'ip': (ip_rate / 60, ip_burst),
+            'email': (email_rate / 60, email_burst),
+        }
+        self.lockout_threshold = lockout_threshold
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.clock = clock
+
+    @staticmethod
+    def normalize_email(email):
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return email.strip().lower()
+
+    def ttl(self, scope):
+        # за это время корзина полностью пополняется и любая блокировка истекает
+        rate, burst = self.scopes[scope]
+        return burst / rate + self.lockout_max
+
+    def take(self, scope, key, now):
+        # забирает токен; возвращает (причина, ожидание) или None
+        rate, burst = self.scopes[scope]
+
+        def fn(state):
+            tokens, updated, failures, locked_until = state or (burst, now, 0, 0)
+            if locked_until > now:
+                return [tokens, updated, failures, locked_until], ('lockout', locked_until - now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return [tokens, now, failures, locked_until], ('rate', (1 - tokens) / rate)
+            return [tokens - 1, now, failures, locked_until], None
+
+        return self.backend.update(f'{scope}:{key}', fn, self.ttl(scope), now)
+
+    def check(self, ip, email):
+        # 0, если попытку можно выполнять, иначе секунды до следующей
+        now = self.clock()
+        keys = [('ip', ip), ('email', self.normalize_email(email))]
+        for scope, key in keys:
+            if key is None:
+                continue
+            rejected = self.take(scope, key, now)
+            if rejected is not None:
+                reason, wait = rejected
+                LOGIN_THROTTLED.inc(scope=scope, reason=reason)
+                return wait
+        return 0
+
+    def register_failure(self, email):
+        # блокировка на lockout_base * 2^n секунд, начиная с lockout_threshold-й ошибки подряд
+        email = self.normalize_email(email)
+        if email is None:
+            return
+        now = self.clock()
+        _, burst = self.scopes['email']
+
+        def fn(state):
+            tokens, updated, failures, locked_until = state or (burst, now, 0, 0)
+            failures += 1
+            if failures >= self.lockout_threshold:
+                duration = self.lockout_base * 2 ** (failures - self.lockout_threshold)
+                locked_until = now + min(duration, self.lockout_max)
+            return [tokens, updated, failures, locked_until], None
+
+        self.backend.update(f'email:{email}', fn, self.ttl('email'), now)
+
+    def register_success(self, email):
+        email = self.normalize_email(email)
+        if email is None:
+            return
+        now = self.clock()
+
+        def fn(state):
+            if state is None:
+                return None, None
+            tokens, updated, failures, locked_until = state
+            return [tokens, updated, 0, 0], None
+
+        self.backend.update(f'email:{email}', fn, self.ttl('email'), now)
+
+
+def request_email(request):
+    # email из тела запроса логина (тело может быть не объектом)
+    return request.data.get('email') if hasattr(request.data, 'get') else None
+
+
+def client_ip(request):
+    # IP клиента с учётом NUM_PROXIES из настроек DRF
+    return BaseThrottle().get_ident(request)
+
+
+class LoginRateThrottle(BaseThrottle):
+    # DRF вызывает throttle в APIView.initial(), до метода post
+
+    def allow_request(self, request, view):
+        if not settings.LOGIN_THROTTLE_ENABLED:
+            return True
+        self.wait_time = login_limiter.check(self.get_ident(request), request_email(request))
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+def create_backend():
+    if settings.LOGIN_THROTTLE_BACKEND == 'redis':
+        return RedisBackend(settings.LOGIN_THROTTLE_REDIS_URL)
+    return MemoryBackend()
+
+
+login_limiter = LoginLimiter(
+    create_backend(),
+    ip_rate=settings.LOGIN_THROTTLE_IP_RATE,
+    ip_burst=settings.LOGIN_THROTTLE_IP_BURST,
+    email_rate=settings.LOGIN_THROTTLE_EMAIL_RATE,
+    email_burst=settings.LOGIN_THROTTLE_EMAIL_BURST,
+    lockout_threshold=settings.LOGIN_LOCKOUT_THRESHOLD,
+    lockout_base=settings.LOGIN_LOCKOUT_BASE,
+    lockout_max=settings.LOGIN_LOCKOUT_MAX,
+)
@@ -1,23 +1,48 @@
+from django.conf import settings
+from django.db import transaction
 from django.urls import path
 from . import views
 
+login_view = views.LoginView.as_view()
+profile_view = views.ProfileView.as_view()
+mock_users_view = views.MockUsersView.as_view()
+mock_products_view = views.MockProductsView.as_view()
+mock_orders_view = views.MockOrdersView.as_view()
+
+if settings.AUTH_ASYNC_VIEWS:
+    # async view несовместимы с ATOMIC_REQUESTS
+    from . import async_views
+    login_view = transaction.non_atomic_requests(async_views.AsyncLoginView.as_view())
+    profile_view = transaction.non_atomic_requests(async_views.AsyncProfileView.as_view())
+    mock_users_view = transaction.non_atomic_requests(async_views.AsyncMockUsersView.as_view())
+    mock_products_view = transaction.non_atomic_requests(async_views.AsyncMockProductsView.as_view())
+    mock_orders_view = transaction.non_atomic_requests(async_views.AsyncMockOrdersView.as_view())
+
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
-    path('login/', views.LoginView.as_view(), name='login'),
+    path('login/', login_view, name='login'),
     path('logout/', views.LogoutView.as_view(), name='logout'),
-    
+    path('.well-known/jwks.json', views.JWKSView.as_view(), name='jwks'),
+    path('token/refresh/', views.TokenRefreshView.as_view(), name='token-refresh'),
+    path('change-password/', views.ChangePasswordView.as_view(), name='change-password'),
+
     # профиль urls
-    path('profile/', views.ProfileView.as_view(), name='profile'),
+    path('profile/', profile_view, name='profile'),
     path('delete-account/', views.DeleteAccountView.as_view(), name='delete-account'),
-    
+
+    path('permissions/check/', views.PermissionCheckView.as_view(), name='permission-check'),
+    path('permissions/me/', views.MyPermissionsView.as_view(), name='permission-me'),
+
     path('roles/', views.RoleListView.as_view(), name='role-list'),
     path('roles/<int:pk>/', views.RoleDetailView.as_view(), name='role-detail'),
     path('elements/', views.BusinessElementListView.as_view(), name='element-list'),
     path('elements/<int:pk>/', views.BusinessElementDetailView.as_view(), name='element-detail'),
     path('access-rules/', views.AccessRuleListView.as_view(), name='access-rule-list'),
+    path('access-rules/bulk/', views.AccessRuleBulkView.as_view(), name='access-rule-bulk'),
+    path('users/bulk/', views.UserBulkLifecycleView.as_view(), name='user-bulk'),
     path('access-rules/<int:pk>/', views.AccessRuleDetailView.as_view(), name='access-rule-detail'),
     # марMOCK url'ы
-    path('mock/users/', views.MockUsersView.as_view(), name='mock-users'),
-    path('mock/products/', views.MockProductsView.as_view(), name='mock-products'),
-    path('mock/orders/', views.MockOrdersView.as_view(), name='mock-orders'),
-]
\ No newline at end of file
+    path('mock/users/', mock_users_view, name='mock-users'),
+    path('mock/products/', mock_products_view, name='mock-products'),
+    path('mock/orders/', mock_orders_view, name='mock-orders'),
+]
@@ -1,69 +1,269 @@
 import jwt
-from datetime import datetime, timedelta
+import time
+import uuid
 from django.contrib.auth.models import User
-import bcrypt
 from decouple import config
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .authentication import TokenUser
+from .cache import user_cache
+from .db import areplica_allowed, replica_allowed, replica_reads
+from .hashing import password_service
+from .instrumentation import phase
+from .keys import key_ring
+from .models import RefreshToken
+from .permissions import get_role_id, get_role_ids, permission_engine
+from .revocation import revocation_store
 
 
  
 class JWTManager:
-    # Менеджер для работы с JWT ТОКЕНАМИ
+    # Менеджер для работы с JWT ТОКЕНАМИ.
+    # access-токен короткий и самодостаточный (роль + версия матрицы прав),
+    # refresh-токен долгий, хранится в БД и меняется при каждом обновлении
 
     SECRET_KEY = config('SECRET_KEY')
-    ALGORITHM = 'HS256'
+    # HS256 - общий секрет; RS256/EdDSA - ключи из key_ring, kid в заголовке
+    ALGORITHM = settings.JWT_ALGORITHM
 
     @staticmethod
-    def create_token(user, expires_delta_hours=24):
-            # создание токена
+    def is_symmetric():
+        return JWTManager.ALGORITHM.startswith('HS')
+
+    @staticmethod
+    def encode(payload):
+        if JWTManager.is_symmetric():
+            return jwt.encode(payload, JWTManager.SECRET_KEY,algorithm=JWTManager.ALGORITHM)
+        kid, private_key = key_ring.signing_key()
+        return jwt.encode(payload, private_key, algorithm=JWTManager.ALGORITHM, headers={'kid': kid})
+
+    @staticmethod
+    def create_token(user, lifetime=None):
+            # создание access-токена
+            # iat с долями секунды - чтобы токен, выданный сразу после
+            # revoke_user, не попадал под отзыв
+            lifetime = lifetime or settings.JWT_ACCESS_TOKEN_LIFETIME
+            now = time.time()
             payload = {
+                  'type':'access',
                   'user_id':user.id,
                   'email':user.email,
-                  'exp':datetime.utcnow()+timedelta(hours=expires_delta_hours),
-                  'iat':datetime.utcnow()  
+                  'role_id':get_role_id(user),
+                  'role_ids':list(get_role_ids(user)),
+                  'pmv':permission_engine.version,
+                  'jti':uuid.uuid4().hex,
+                  'exp':now+lifetime.total_seconds(),
+                  'iat':now
             }
 
-            token = jwt.encode(payload, JWTManager.SECRET_KEY,algorithm=JWTManager.ALGORITHM)
-            return token
+            return JWTManager.encode(payload)
+
+    @staticmethod
+    def create_refresh_token(user, family=None):
+            # создание refresh-токена (запись в БД нужна для ротации)
+            now = timezone.now()
+            expires_at = now + settings.JWT_REFRESH_TOKEN_LIFETIME
+            record = RefreshToken.objects.create(
+                  jti=uuid.uuid4().hex,
+                  family=family or uuid.uuid4().hex,
+                  user=user,
+                  expires_at=expires_at,
+            )
+            payload = {
+                  'type':'refresh',
+                  'user_id':user.id,
+                  'jti':record.jti,
+                  'family':record.family,
+                  'exp':expires_at.timestamp(),
+                  'iat':now.timestamp()
+            }
+            return JWTManager.encode(payload)
+
+    @staticmethod
+    def create_token_pair(user, family=None):
+        return {
+            'token': JWTManager.create_token(user),
+            'refresh': JWTManager.create_refresh_token(user, family),
+        }
     
     @staticmethod
     def decode_token(token):
         # декодинг токена
 
         try:
-            payload = jwt.decode(token,JWTManager.SECRET_KEY, algorithms=[JWTManager.ALGORITHM])
+            with phase('token_decode'):
+                if JWTManager.is_symmetric():
+                    key = JWTManager.SECRET_KEY
+                else:
+                    key = key_ring.verifier(jwt.get_unverified_header(token).get('kid'))
+                    if key is None:
+                        raise jwt.InvalidTokenError('Неизвестный kid')
+                payload = jwt.decode(token,key, algorithms=[JWTManager.ALGORITHM])
             return payload
         except jwt.ExpiredSignatureError:
              raise ValueError('Токен истёк')
         except jwt.InvalidTokenError:
              raise ValueError('Неверный токен')
-        
+
     @staticmethod
-    def get_user_from_token(token):
-        #  получение пользователя по токену
+    def refresh_token_pair(token):
+        # ротация: refresh-токен обменивается ровно один раз.
+        # Повторное предъявление - признак кражи: отзывается всё семейство
+        payload = JWTManager.decode_token(token)
+        if payload.get('type') != 'refresh':
+            raise ValueError('Неверный токен')
+
+        with transaction.atomic():
+            # блокируется только строка токена: FOR UPDATE не применим к внешнему
+            # соединению с профилем, пользователь читается отдельным запросом
+            try:
+                record = RefreshToken.objects.select_for_update(of=('self',)).get(jti=payload.get('jti'))
+            except RefreshToken.DoesNotExist:
+                raise ValueError('Неверный токен')
+            if record.revoked_at is not None:
+                raise ValueError('Токен отозван')
+
+            user = (
+                User.objects.select_related('profile').prefetch_related('profile__roles')
+                .filter(pk=record.user_id, is_active=True).first()
+            )
+            if user is None:
+                raise ValueError('Токен отозван')
+
+            now = timezone.now()
+            reused = record.used_at is not None
+            if reused:
+                RefreshToken.objects.filter(family=record.family, revoked_at__isnull=True).update(revoked_at=now)
+                JWTManager.revoke_user_tokens(record.user_id)
+            else:
+                record.used_at = now
+                record.save(update_fields=['used_at'])
+                tokens = JWTManager.create_token_pair(user, family=record.family)
+
+        # исключение после выхода из atomic, чтобы отзыв семейства закоммитился
+        if reused:
+            raise ValueError('Повторное использование refresh-токена')
+        return tokens
+
+    @staticmethod
+    def authenticate(token):
+        #  (пользователь, payload) по токену или (None, None).
+        #  Актуальный access-токен проверяется без БД, иначе пользователь из кэша/БД
+        try:
+             payload = JWTManager.decode_token(token)
+             # только access-токены: токены без type (24 ч, без jti) нельзя отозвать
+             # за окно денайлиста, поэтому они больше не принимаются
+             if payload.get('type') != 'access' or revocation_store.is_revoked(payload):
+                  return None, None
+             if payload.get('pmv') == permission_engine.version:
+                  return TokenUser(payload), payload
+             user_id = payload.get('user_id')
+             iat = payload.get('iat')
+             with phase('user_lookup'):
+                  user = user_cache.get(user_id, iat)
+                  if user is None:
+                       # после записи пользователь читает с default, как в ReplicaReadMixin
+                       with replica_reads(replica_allowed(user_id)):
+                            user = User.objects.select_related('profile').prefetch_related('profile__roles').get(id=user_id,is_active=True)
+                       user_cache.set(user_id, iat, user, ttl=payload['exp'] - time.time())
+             return user, payload
+        except (ValueError, User.DoesNotExist):
+             return None, None
+
+    @staticmethod
+    async def aauthenticate(token):
+        #  то же самое через async ORM (для ASGI)
         try:
              payload = JWTManager.decode_token(token)
+             if payload.get('type') != 'access' or await revocation_store.ais_revoked(payload):
+                  return None, None
+             if payload.get('pmv') == (await permission_engine.amatrix()).version:
+                  return TokenUser(payload), payload
              user_id = payload.get('user_id')
-             user = User.objects.get(id=user_id,is_active=True)
-             return user
+             iat = payload.get('iat')
+             user = user_cache.get(user_id, iat)
+             if user is None:
+                  with replica_reads(await areplica_allowed(user_id)):
+                       user = await User.objects.select_related('profile').prefetch_related('profile__roles').aget(id=user_id,is_active=True)
+                  user_cache.set(user_id, iat, user, ttl=payload['exp'] - time.time())
+             return user, payload
         except (ValueError, User.DoesNotExist):
-             return None
+             return None, None
+
+    @staticmethod
+    def get_user_from_token(token):
+        #  получение пользователя по токену
+        return JWTManager.authenticate(token)[0]
+
+    @staticmethod
+    async def aget_user_from_token(token):
+        return (await JWTManager.aauthenticate(token))[0]
+
+    @staticmethod
+    def revoke_token(payload):
+        #  отзыв конкретного токена (logout)
+        revocation_store.revoke_token(payload)
+
+    @staticmethod
+    def revoke_refresh_token(token):
+        #  отзыв семейства refresh-токена (logout); чужие и битые токены игнорируются
+        try:
+             payload = JWTManager.decode_token(token)
+        except ValueError:
+             return
+        if payload.get('type') == 'refresh':
+             RefreshToken.objects.filter(
+                  family=payload.get('family'), user_id=payload.get('user_id'), revoked_at__isnull=True,
+             ).update(revoked_at=timezone.now())
+
+    @staticmethod
+    def revoke_user_tokens(user_id):
+        #  отзыв всех выданных токенов пользователя (access и refresh)
+        revocation_store.revoke_user(user_id)
+        RefreshToken.objects.filter(user_id=user_id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+        user_cache.invalidate_on_commit(user_id)
+
+    @staticmethod
+    def revoke_users_tokens(user_ids):
+        #  то же для пачки пользователей: по одному запросу на таблицу
+        user_ids = list(user_ids)
+        revocation_store.revoke_users(user_ids)
+        RefreshToken.objects.filter(user_id__in=user_ids, revoked_at__isnull=True).update(revoked_at=timezone.now())
+        user_cache.invalidate_many_on_commit(user_ids)
         
 
 class PasswordHasher:
-    #  класс для раблоты с паролями:
+    #  класс для раблоты с паролями. Алгоритм и стоимость - из настроек PASSWORD_*,
+    #  хэш хранится в формате Django (алгоритм$параметры$...), вычисляется в пуле password_service
     @staticmethod
     def hash_password(password):
         #  хэширование пароля
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password_bytes,salt)
-        return hashed.decode('utf-8')
+        return password_service.hash_password(password)
 
+    @staticmethod
+    def verify(password, hashed_password):
+        #  (пароль верный, хэш устарел по текущей политике)
+        return password_service.verify_password(password, hashed_password)
 
     @staticmethod
     def check_password(password, hashed_password):
         #  Проверка пароля
-        password_bytes = password.encode('utf-8')
-        hashed_bytes = hashed_password.encode('utf-8')
-        return bcrypt.checkpw(password_bytes,hashed_bytes)
\ No newline at end of file
+        return PasswordHasher.verify(password, hashed_password)[0]
+
+    @staticmethod
+    def set_password(user, password):
+        #  как user.set_password, но хэш считается в пуле
+        user.password = PasswordHasher.hash_password(password)
+
+    @staticmethod
+    async def ahash_password(password):
+        return await password_service.ahash_password(password)
+
+    @staticmethod
+    async def averify(password, hashed_password):
+        return await password_service.averify_password(password, hashed_password)
+
+    @staticmethod
+    async def acheck_password(password, hashed_password):
+        return (await PasswordHasher.averify(password, hashed_password))[0]
@@ -1,11 +1,24 @@
+import codecs
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.contrib.auth.models import User
 from .models import UserProfile, Role, BusinessElement, AccessRule
-from .serializers import UserSerializer, UserProfileSerializer, LoginSerializer, UpdateProfileSerializer, RoleSerializer, BusinessElementSerializer, AccessRuleSerializer
-from .utils import JWTManager, PasswordHasher
+from .serializers import UserSerializer, LoginSerializer, UpdateProfileSerializer, RoleSerializer, BusinessElementSerializer, AccessRuleSerializer, ChangePasswordSerializer, TokenRefreshSerializer, PermissionCheckSerializer, UserBulkActionSerializer, fast_login_user_serializer, fast_profile_serializer
+from .utils import JWTManager
+from .activity import login_activity
+from .cache import profile_cache
+from .db import ReplicaReadMixin
+from .instrumentation import phase
+from .keys import key_ring
+from .pagination import IdCursorPagination
+from .permissions import HasElementPermission, permission_engine
+from .public_urls import public_view
+from .throttling import LoginRateThrottle, LoginThrottled, client_ip, login_limiter, request_email
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django.utils import timezone
+from . import bulk, lifecycle
 
 
 class RegisterView(APIView):
@@ -25,72 +38,151 @@ class RegisterView(APIView):
             )
             
            
-            token = JWTManager.create_token(user)
+            tokens = JWTManager.create_token_pair(user)
             
             return Response({
                 'message': 'Регистрация успешна',
                 'user': UserSerializer(user).data,
-                'token': token
+                **tokens
             }, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class LoginView(APIView):
-    # логин
+    # логин; LoginRateThrottle отсекает перебор до обращения к БД и хэширования
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
     
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         
         if serializer.is_valid():
             user = serializer.validated_data['user']
+            login_limiter.register_success(user.email)
             
-            token = JWTManager.create_token(user)
+            tokens = JWTManager.create_token_pair(user)
             
+            # last_login пишется в БД пачкой из буфера, не в запросе
             user.last_login = timezone.now()
-            user.save()
+            login_activity.add(user.id, user.last_login, client_ip(request))
             
-            return Response({
-                'message': 'Вход выполнен успешно',
-                'user': {
-                    'id': user.id,
-                    'email': user.email,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name
-                },
-                'token': token,
-                'role': user.profile.role.name if hasattr(user, 'profile') and user.profile.role else None
-            }, status=status.HTTP_200_OK)
+            return Response(self.get_response_data(user, tokens), status=status.HTTP_200_OK)
         
+        login_limiter.register_failure(request_email(request))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def throttled(self, request, wait):
+        raise LoginThrottled(wait)
+
+    @staticmethod
+    def get_response_data(user, tokens):
+        return {
+            'message': 'Вход выполнен успешно',
+            'user': fast_login_user_serializer.to_representation(user),
+            **tokens,
+            'role': user.profile.role.name if hasattr(user, 'profile') and user.profile.role else None
+        }
+
 
 class LogoutView(APIView):
     
     def post(self, request):
+        # access-токен попадает в денайлист до истечения срока,
+        # переданный refresh-токен отзывается вместе с семейством
+        if request.auth:
+            JWTManager.revoke_token(request.auth)
+        if request.data.get('refresh'):
+            JWTManager.revoke_refresh_token(request.data['refresh'])
         return Response({
-            'message': 'Выход выполнен успешно. Удалите токен на клиенте.'
+            'message': 'Выход выполнен успешно'
         }, status=status.HTTP_200_OK)
 
 
+@public_view
+class JWKSView(APIView):
+    # публичные ключи для локальной проверки токенов другими сервисами
+    permission_classes = [permissions.AllowAny]
 
-class ProfileView(APIView):
-    
     def get(self, request):
+        data = {'keys': []} if JWTManager.is_symmetric() else key_ring.jwks()
+        response = Response(data)
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+
+
+@public_view
+class TokenRefreshView(APIView):
+    # обмен refresh-токена на новую пару; единственный путь, которому нужна БД
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tokens = JWTManager.refresh_token_pair(serializer.validated_data['refresh'])
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_401_UNAUTHORIZED)
+
+        return Response(tokens, status=status.HTTP_200_OK)
+
+
+class ChangePasswordView(APIView):
+    # смена пароля: все ранее выданные токены отзываются, выдаётся новый
+
+    def post(self, request):
+        serializer = ChangePasswordSerializer(data=request.data, context={'request': request})
+
+        if serializer.is_valid():
+            user = serializer.save()
+            JWTManager.revoke_user_tokens(user.id)
+            return Response({
+                'message': 'Пароль изменен',
+                **JWTManager.create_token_pair(user)
+            }, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+class ProfileView(ReplicaReadMixin, APIView):
+    # GET отдаёт снимок профиля из profile_cache с ETag;
+    # при совпадении If-None-Match - 304 без обращения к БД и сериализатору
+
+    @staticmethod
+    def not_modified(request, etag):
+        return etag in parse_etags(request.headers.get('If-None-Match', ''))
+
+    @staticmethod
+    def build_snapshot(user_id):
         try:
-            profile = UserProfile.objects.get(user=request.user)
-            serializer = UserProfileSerializer(profile)
-            return Response(serializer.data)
+            profile = UserProfile.objects.select_related('user', 'role').get(user_id=user_id)
         except UserProfile.DoesNotExist:
-            return Response(
-                {'error': 'Профиль не найден'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
+            return None
+        return fast_profile_serializer.to_representation(profile)
+
+    def get(self, request):
+        version = profile_cache.current_version(request.user.id)
+        etag = quote_etag(version)
+        if self.not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = profile_cache.get(request.user.id, version)
+        if data is None:
+            data = self.build_snapshot(request.user.id)
+            if data is None:
+                return Response(
+                    {'error': 'Профиль не найден'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            profile_cache.set(request.user.id, version, data)
+        return Response(data, headers={'ETag': etag})
     
     def put(self, request):
         try:
-            profile = UserProfile.objects.get(user=request.user)
+            profile = UserProfile.objects.select_related('user', 'role').get(user_id=request.user.id)
         except UserProfile.DoesNotExist:
             return Response(
                 {'error': 'Профиль не найден'}, 
@@ -103,7 +195,7 @@ class ProfileView(APIView):
             serializer.save()
             return Response({
                 'message': 'Профиль обновлен',
-                'profile': UserProfileSerializer(profile).data
+                'profile': fast_profile_serializer.to_representation(profile)
             })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -113,7 +205,7 @@ class DeleteAccountView(APIView):
     
     def post(self, request):
         try:
-            profile = UserProfile.objects.get(user=request.user)
+            profile = UserProfile.objects.get(user_id=request.user.id)
         except UserProfile.DoesNotExist:
             return Response(
                 {'error': 'Профиль не найден'}, 
@@ -128,89 +220,187 @@ class DeleteAccountView(APIView):
 
 
 
+class PermissionCheckView(APIView):
+    # пачка проверок прав текущего пользователя одним запросом:
+    # {"checks": [{"element": "users", "action": "read", "owner_id": 1}, ...]}
+
+    def post(self, request):
+        serializer = PermissionCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        checks = [
+            (item['element'], item['action'], item.get('owner_id'))
+            for item in serializer.validated_data['checks']
+        ]
+        with phase('permission_check'):
+            results = permission_engine.check_many(request.user, checks)
+        return Response({'results': results, 'version': permission_engine.version})
+
+
+class MyPermissionsView(APIView):
+    # все права текущего пользователя по элементам
+
+    def get(self, request):
+        with phase('permission_check'):
+            permissions_map = permission_engine.effective_permissions(request.user)
+        return Response({'permissions': permissions_map, 'version': permission_engine.version})
+
+
 class IsAdminPermission(permissions.BasePermission):
+    # роль сверяется по id из матрицы прав, без загрузки профиля и роли
     
     def has_permission(self, request, view):
-        if hasattr(request.user, 'profile') and request.user.profile.role:
-            return request.user.profile.role.name == 'admin'
-        return False
+        with phase('permission_check'):
+            return permission_engine.has_role(request.user, 'admin')
 
 
-class RoleListView(generics.ListCreateAPIView):
+class RoleListView(ReplicaReadMixin, generics.ListCreateAPIView):
     """Список и создание ролей (только для админов)"""
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = [IsAdminPermission]
+    pagination_class = IdCursorPagination
 
 
-class RoleDetailView(generics.RetrieveUpdateDestroyAPIView):
+class RoleDetailView(ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     """Детали, обновление и удаление роли (только для админов)"""
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
     permission_classes = [IsAdminPermission]
 
 
-class BusinessElementListView(generics.ListCreateAPIView):
+class BusinessElementListView(ReplicaReadMixin, generics.ListCreateAPIView):
     """Список и создание бизнес-элементов (только для админов)"""
     queryset = BusinessElement.objects.all()
     serializer_class = BusinessElementSerializer
     permission_classes = [IsAdminPermission]
+    pagination_class = IdCursorPagination
 
 
-class BusinessElementDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BusinessElementDetailView(ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     """Детали, обновление и удаление бизнес-элемента (только для админов)"""
     queryset = BusinessElement.objects.all()
     serializer_class = BusinessElementSerializer
     permission_classes = [IsAdminPermission]
 
 
-class AccessRuleListView(generics.ListCreateAPIView):
+class AccessRuleListView(ReplicaReadMixin, generics.ListCreateAPIView):
     """Список и создание правил доступа (только для админов)"""
-    queryset = AccessRule.objects.all()
+    queryset = AccessRule.objects.select_related('role', 'element')
     serializer_class = AccessRuleSerializer
     permission_classes = [IsAdminPermission]
+    pagination_class = IdCursorPagination
+
+
+class AccessRuleBulkView(APIView):
+    """Массовый импорт (POST) и потоковый экспорт (GET) правил доступа, ?fmt=jsonl|csv (только для админов)"""
+    permission_classes = [IsAdminPermission]
+
+    def get_format(self, request):
+        fmt = request.query_params.get('fmt', 'jsonl')
+        return fmt if fmt in bulk.FORMATS else None
+
+    def get(self, request):
+        fmt = self.get_format(request)
+        if fmt is None:
+            return Response({'error': 'Неизвестный формат'}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(bulk.export_access_rules(fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="access_rules.{fmt}"'
+        return response
+
+    def post(self, request):
+        fmt = self.get_format(request)
+        if fmt is None:
+            return Response({'error': 'Неизвестный формат'}, status=status.HTTP_400_BAD_REQUEST)
+        # тело читается построчно, без загрузки в память целиком
+        lines = codecs.iterdecode(request._request, 'utf-8')
+        try:
+            count = bulk.import_access_rules(lines, fmt)
+        except bulk.BulkImportError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({'error': 'Данные должны быть в UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': 'Правила доступа импортированы', 'count': count})
+
+
+class UserBulkLifecycleView(APIView):
+    """Массовое удаление, восстановление и смена роли пользователей (только для админов)"""
+    permission_classes = [IsAdminPermission]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # пачки коммитятся по отдельности, а не одной транзакцией запроса
+        return transaction.non_atomic_requests(super().as_view(**initkwargs))
+
+    def post(self, request):
+        serializer = UserBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        user_ids = lifecycle.select_user_ids(
+            user_ids=data.get('user_ids'), role=data.get('filter_role'), email_domain=data.get('email_domain'),
+        )
+        try:
+            count = lifecycle.run(
+                data['action'], user_ids, role=data.get('role'),
+                clear_extra=data['clear_extra_roles'], chunk_size=data['chunk_size'],
+            )
+        except lifecycle.LifecycleError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'action': data['action'], 'selected': len(user_ids), 'changed': count})
 
 
-class AccessRuleDetailView(generics.RetrieveUpdateDestroyAPIView):
+class AccessRuleDetailView(ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     """Детали, обновление и удаление правила доступа (только для админов)"""
-    queryset = AccessRule.objects.all()
+    queryset = AccessRule.objects.select_related('role', 'element')
     serializer_class = AccessRuleSerializer
     permission_classes = [IsAdminPermission]
 
 
 class MockUsersView(APIView):
     """Mock API для тестирования доступа к ресурсу 'users'"""
-    
+    permission_classes = [HasElementPermission]
+    business_element = 'users'
+    mock_response = {
+        'message': 'Доступ к ресурсу "Пользователи" разрешен',
+        'data': [
+            {'id': 1, 'name': 'Иван Иванов', 'email': 'ivan@example.com'},
+            {'id': 2, 'name': 'Петр Петров', 'email': 'petr@example.com'},
+        ]
+    }
+
     def get(self, request):
-        return Response({
-            'message': 'Доступ к ресурсу "Пользователи" разрешен',
-            'data': [
-                {'id': 1, 'name': 'Иван Иванов', 'email': 'ivan@example.com'},
-                {'id': 2, 'name': 'Петр Петров', 'email': 'petr@example.com'},
-            ]
-        })
+        return Response(self.mock_response)
 
 
 class MockProductsView(APIView):
     """Mock API для тестирования доступа к ресурсу 'products'"""
-    
+    permission_classes = [HasElementPermission]
+    business_element = 'products'
+    mock_response = {
+        'message': 'Доступ к ресурсу "Товары" разрешен',
+        'data': [
+            {'id': 1, 'name': 'Ноутбук', 'price': 50000},
+            {'id': 2, 'name': 'Смартфон', 'price': 30000},
+        ]
+    }
+
     def get(self, request):
-        return Response({
-            'message': 'Доступ к ресурсу "Товары" разрешен',
-            'data': [
-                {'id': 1, 'name': 'Ноутбук', 'price': 50000},
-                {'id': 2, 'name': 'Смартфон', 'price': 30000},
-            ]
-        })
+        return Response(self.mock_response)
 
 class MockOrdersView(APIView):
     """Mock API для тестирования доступа к ресурсу 'orders'"""
-    
+    permission_classes = [HasElementPermission]
+    business_element = 'orders'
+    mock_response = {
+        'message': 'Доступ к ресурсу "Заказы" разрешен',
+        'data': [
+            {'id': 1, 'order_number': 'ORD-001', 'total': 80000},
+            {'id': 2, 'order_number': 'ORD-002', 'total': 30000},
+        ]
+    }
+
     def get(self, request):
-        return Response({
-            'message': 'Доступ к ресурсу "Заказы" разрешен',
-            'data': [
-                {'id': 1, 'order_number': 'ORD-001', 'total': 80000},
-                {'id': 2, 'order_number': 'ORD-002', 'total': 30000},
-            ]
-        })
\ No newline at end of file
+        return Response(self.mock_response)
\ No newline at end of file
@@ -1,4 +1,6 @@
-from decouple import config
+import sys
+from datetime import timedelta
+from decouple import Csv, config
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -7,6 +9,9 @@ SECRET_KEY = config('SECRET_KEY')
 
 DEBUG = config('DEBUG', default=False, cast=bool)
 
+# manage.py test
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS',default='').split(',')
 
@@ -45,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
+    'auth_app.instrumentation.RequestInstrumentationMiddleware',
     'auth_app.middleware.JWTAuthenticationMiddleware',
 ]
 
@@ -71,18 +77,52 @@ WSGI_APPLICATION = 'auth_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Постоянные соединения с проверкой перед использованием. DB_POOL включает пул
+# psycopg (Django 5.1+); с пулом CONN_MAX_AGE должен быть 0
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=2, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+
+
+def postgres_database(host, port, **extra):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': config('POSTGRES_DB', default='modelhub'),
         'USER': config('POSTGRES_USER',default='postgres'),
         'PASSWORD': config('POSTGRES_PASSWORD',default='password'),
-        'HOST': config('POSTGRES_HOST',default='localhost'),
-        'PORT': config('POSTGRES_PORT',default='5432'),
-        'ATOMIC_REQUESTS': True,
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DB_POOL:
+        database['OPTIONS'] = {'pool': {'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE}}
+    database.update(extra)
+    return database
+
+
+DATABASES = {
+    'default': postgres_database(
+        config('POSTGRES_HOST',default='localhost'),
+        config('POSTGRES_PORT',default='5432'),
+        ATOMIC_REQUESTS=True,
+    ),
+    # реплика для чтения; в тестах - зеркало default
+    'replica': postgres_database(
+        config('POSTGRES_REPLICA_HOST', default=config('POSTGRES_HOST', default='localhost')),
+        config('POSTGRES_REPLICA_PORT', default=config('POSTGRES_PORT', default='5432')),
+        TEST={'MIRROR': 'default'},
+    ),
 }
 
+# Чтение с реплик (алиасы из DATABASES через запятую, пусто - всё с default):
+# поиск пользователя по токену, GET профиля и админских списков
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+DATABASE_ROUTERS = ['auth_app.db.ReplicaRouter']
+# сколько секунд после записи пользователь читает с default (отставание реплики)
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -125,16 +165,17 @@ STATIC_ROOT = BASE_DIR / 'staticfiles' # путь для всех файлов 
 # Настройки REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        
+        'auth_app.authentication.JWTMiddlewareAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson, если установлен; иначе - стандартный JSON из DRF
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'auth_app.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'auth_app.renderers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ],
@@ -143,6 +184,108 @@ REST_FRAMEWORK = {
 }
 
 
+# URL, не требующие аутентификации (дополняются view с @public_view)
+AUTH_PUBLIC_URLS = [
+    r'^/api/auth/register/$',
+    r'^/api/auth/login/$',
+    r'^/admin/',
+    r'^/admin/login/',
+    r'^/api/docs/',
+]
+
+# JWT
+# HS256 (SECRET_KEY) или RS256/EdDSA с ключами <kid>.pem из JWT_KEYS_DIR
+JWT_ALGORITHM = config('JWT_ALGORITHM', default='HS256')
+JWT_KEYS_DIR = config('JWT_KEYS_DIR', default=str(BASE_DIR / 'keys'))
+JWT_ACTIVE_KID = config('JWT_ACTIVE_KID', default='')
+JWT_ACCESS_TOKEN_LIFETIME = timedelta(minutes=config('JWT_ACCESS_TOKEN_LIFETIME_MINUTES', default=15, cast=int))
+JWT_REFRESH_TOKEN_LIFETIME = timedelta(days=config('JWT_REFRESH_TOKEN_LIFETIME_DAYS', default=14, cast=int))
+# как часто процесс подтягивает из БД токены, отозванные другими процессами (сек)
+JWT_REVOCATION_SYNC_INTERVAL = config('JWT_REVOCATION_SYNC_INTERVAL', default=5, cast=int)
+
+# Общий кэш процессов (поколение матрицы прав, снимки профиля, привязка к primary).
+# Без CACHE_URL - LocMemCache, своя копия в каждом процессе
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+    }
+
+# Матрица прав: поколение в кэше PERMISSION_CACHE_ALIAS сверяется раз в N секунд,
+# изменение правил в любом процессе (включая команды manage.py) пересобирает матрицу во всех
+PERMISSION_CACHE_ALIAS = config('PERMISSION_CACHE_ALIAS', default='default')
+PERMISSION_MATRIX_CHECK_INTERVAL = config('PERMISSION_MATRIX_CHECK_INTERVAL', default=1, cast=float)
+
+# Кэш пользователей, проверенных по JWT
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)
+
+# Снимки ответа /profile/ (алиас из CACHES; для нескольких воркеров - общий кэш, например Redis)
+PROFILE_CACHE_ALIAS = config('PROFILE_CACHE_ALIAS', default='default')
+PROFILE_CACHE_TTL = config('PROFILE_CACHE_TTL', default=300, cast=int)
+
+# Пул хэширования паролей (thread | process)
+PASSWORD_HASHING_EXECUTOR = config('PASSWORD_HASHING_EXECUTOR', default='thread')
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=4, cast=int)
+PASSWORD_HASHING_QUEUE_LIMIT = config('PASSWORD_HASHING_QUEUE_LIMIT', default=32, cast=int)
+PASSWORD_HASHING_RETRY_AFTER = config('PASSWORD_HASHING_RETRY_AFTER', default=1, cast=int)
+
+# Политика хэширования паролей (bcrypt_sha256 | argon2). Стоимость подбирается
+# командой calibrate_password_hash; старые хэши пересчитываются при входе
+PASSWORD_HASH_ALGORITHM = config('PASSWORD_HASH_ALGORITHM', default='bcrypt_sha256')
+PASSWORD_BCRYPT_ROUNDS = config('PASSWORD_BCRYPT_ROUNDS', default=12, cast=int)
+PASSWORD_ARGON2_TIME_COST = config('PASSWORD_ARGON2_TIME_COST', default=2, cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config('PASSWORD_ARGON2_MEMORY_COST', default=102400, cast=int)
+PASSWORD_ARGON2_PARALLELISM = config('PASSWORD_ARGON2_PARALLELISM', default=8, cast=int)
+
+_POLICY_HASHERS = {
+    'bcrypt_sha256': 'auth_app.hashers.PolicyBCryptSHA256PasswordHasher',
+    'argon2': 'auth_app.hashers.PolicyArgon2PasswordHasher',
+}
+# первый хэшер - для новых паролей, остальные - только для проверки старых хэшей
+PASSWORD_HASHERS = [_POLICY_HASHERS[PASSWORD_HASH_ALGORITHM]] + [
+    hasher for name, hasher in _POLICY_HASHERS.items() if name != PASSWORD_HASH_ALGORITHM
+] + [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+]
+
+# Ограничение попыток входа: корзины на IP и email (попыток в минуту / ёмкость),
+# блокировка email на LOGIN_LOCKOUT_BASE * 2^n сек после серии ошибок.
+# memory - счётчики в процессе, redis - общие для всех воркеров
+LOGIN_THROTTLE_ENABLED = config('LOGIN_THROTTLE_ENABLED', default=True, cast=bool)
+LOGIN_THROTTLE_BACKEND = config('LOGIN_THROTTLE_BACKEND', default='memory')
+LOGIN_THROTTLE_REDIS_URL = config('LOGIN_THROTTLE_REDIS_URL', default='redis://localhost:6379/0')
+LOGIN_THROTTLE_IP_RATE = config('LOGIN_THROTTLE_IP_RATE', default=30, cast=int)
+LOGIN_THROTTLE_IP_BURST = config('LOGIN_THROTTLE_IP_BURST', default=30, cast=int)
+LOGIN_THROTTLE_EMAIL_RATE = config('LOGIN_THROTTLE_EMAIL_RATE', default=5, cast=int)
+LOGIN_THROTTLE_EMAIL_BURST = config('LOGIN_THROTTLE_EMAIL_BURST', default=5, cast=int)
+LOGIN_LOCKOUT_THRESHOLD = config('LOGIN_LOCKOUT_THRESHOLD', default=5, cast=int)
+LOGIN_LOCKOUT_BASE = config('LOGIN_LOCKOUT_BASE', default=30, cast=int)
+LOGIN_LOCKOUT_MAX = config('LOGIN_LOCKOUT_MAX', default=3600, cast=int)
+
+# Отложенная запись last_login / счётчика входов / IP: пачкой раз в N мс или по N записей.
+# 0 мс - без фонового потока (в тестах: поток писал бы в БД после её удаления)
+LOGIN_ACTIVITY_FLUSH_INTERVAL_MS = config('LOGIN_ACTIVITY_FLUSH_INTERVAL_MS', default=0 if TESTING else 1000, cast=int)
+LOGIN_ACTIVITY_FLUSH_SIZE = config('LOGIN_ACTIVITY_FLUSH_SIZE', default=500, cast=int)
+# предел буфера (пользователей); при переполнении - синхронный сброс
+LOGIN_ACTIVITY_MAX_SIZE = config('LOGIN_ACTIVITY_MAX_SIZE', default=100000, cast=int)
+
+# Через сколько дней мягко удалённые пользователи удаляются окончательно (purge_deleted_users)
+USER_PURGE_AFTER_DAYS = config('USER_PURGE_AFTER_DAYS', default=30, cast=int)
+
+# Замеры фаз запроса: заголовок Server-Timing и гистограммы на /metrics
+AUTH_INSTRUMENTATION = config('AUTH_INSTRUMENTATION', default=False, cast=bool)
+# /metrics (только при AUTH_INSTRUMENTATION): адреса/сети сборщика метрик; остальным нужен
+# токен staff/admin. Сравнивается REMOTE_ADDR - адрес прокси на том же хосте сюда не добавлять
+AUTH_METRICS_ALLOWED_IPS = config('AUTH_METRICS_ALLOWED_IPS', default='', cast=Csv())
+
+# Async-версии LoginView, ProfileView и mock-views (для ASGI, требуется adrf)
+AUTH_ASYNC_VIEWS = config('AUTH_ASYNC_VIEWS', default=False, cast=bool)
+
+
 SECURE_BROWSER_XSS_FILTER = True  # Защита от XSS-атак
 SECURE_CONTENT_TYPE_NOSNIFF = True  # Запрет MIME-типов
 X_FRAME_OPTIONS = 'DENY'  # Защита от кликджекинга
@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from auth_app.instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('auth_app.urls')),
 ]
+
+if settings.AUTH_INSTRUMENTATION:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
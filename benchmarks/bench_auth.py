@@ -0,0 +1,151 @@
+"""
+Сквозной бенчмарк горячих путей аутентификации: пропускная способность
+и p50/p95/p99 для логина, регистрации, middleware, профиля и админских
+списков на нескольких объёмах данных. Результат - JSON для сравнения коммитов.
+
+    BENCH_DB=sqlite python benchmarks/bench_auth.py --sizes 100,1000 --output bench.json
+    BENCH_DB=postgres python benchmarks/bench_auth.py --sizes 1000,100000
+"""
+import argparse
+import io
+
+from common import measure, print_table, setup_django, summarize, teardown_django, write_results
+
+SCENARIOS = [
+    'login',
+    'register',
+    'middleware_fast_path',
+    'profile_get',
+    'profile_put',
+    'admin_roles',
+    'admin_elements',
+    'admin_access_rules',
+]
+
+
+def reset():
+    # каждый объём замеряется на чистой БД и с пустыми кэшами процесса
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from auth_app.cache import user_cache
+    from auth_app.permissions import permission_engine
+    from auth_app.revocation import revocation_store
+
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    user_cache.clear()
+    revocation_store.clear()
+    permission_engine.invalidate()
+
+
+def check(response, expected):
+    # ошибка вместо замера ответов 4xx/5xx
+    if response.status_code != expected:
+        raise AssertionError(f'{response.status_code} вместо {expected}: {response.content[:200]!r}')
+
+
+def prepare(size, seed):
+    # данные: базовые фикстуры + синтетические пользователи/роли/правила
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from auth_app.models import Role, UserProfile
+    from auth_app.utils import JWTManager
+
+    reset()
+    call_command('seed_data', stdout=io.StringIO())
+    call_command(
+        'seed_data', users=size, roles=max(4, size // 100), elements=max(4, size // 50),
+        seed=seed, stdout=io.StringIO(),
+    )
+    admin = User.objects.get(email='admin@example.com')
+    UserProfile.objects.get_or_create(user=admin, defaults={'role': Role.objects.get(name='admin')})
+    user = User.objects.get(username=f'load-{seed}-0')
+    return {
+        'admin_token': JWTManager.create_token(admin),
+        'user_token': JWTManager.create_token(user),
+        'login_email': user.email,
+    }
+
+
+def run_scenarios(size, seed, number, scenarios):
+    from django.http import HttpResponse
+    from django.test import Client, RequestFactory
+    from auth_app.middleware import JWTAuthenticationMiddleware
+
+    context = prepare(size, seed)
+    client = Client()
+    admin_auth = {'HTTP_AUTHORIZATION': f'Bearer {context["admin_token"]}'}
+    user_auth = {'HTTP_AUTHORIZATION': f'Bearer {context["user_token"]}'}
+    middleware = JWTAuthenticationMiddleware(lambda request: HttpResponse())
+    factory = RequestFactory()
+
+    def login(i):
+        check(client.post('/api/auth/login/', {'email': context['login_email'], 'password': 'load-test-123'},
+                          content_type='application/json'), 200)
+
+    def register(i):
+        check(client.post('/api/auth/register/', {
+            'username': f'bench-{size}-{i}', 'email': f'bench-{size}-{i}@example.com',
+            'first_name': 'Bench', 'last_name': 'Mark',
+            'password': 'Bench-pass-9431', 'password2': 'Bench-pass-9431',
+        }, content_type='application/json'), 201)
+
+    def middleware_fast_path(i):
+        check(middleware(factory.get('/api/auth/profile/', **user_auth)), 200)
+
+    def profile_get(i):
+        check(client.get('/api/auth/profile/', **user_auth), 200)
+
+    def profile_put(i):
+        check(client.put('/api/auth/profile/', {'middle_name': f'Отчество{i}'},
+                         content_type='application/json', **user_auth), 200)
+
+    def admin_roles(i):
+        check(client.get('/api/auth/roles/', **admin_auth), 200)
+
+    def admin_elements(i):
+        check(client.get('/api/auth/elements/', **admin_auth), 200)
+
+    def admin_access_rules(i):
+        check(client.get('/api/auth/access-rules/', **admin_auth), 200)
+
+    functions = {
+        'login': login,
+        'register': register,
+        'middleware_fast_path': middleware_fast_path,
+        'profile_get': profile_get,
+        'profile_put': profile_put,
+        'admin_roles': admin_roles,
+        'admin_elements': admin_elements,
+        'admin_access_rules': admin_access_rules,
+    }
+    results = []
+    for scenario in scenarios:
+        samples = measure(functions[scenario], number)
+        results.append({'size': size, 'scenario': scenario, **summarize(samples)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='100,1000', help='Количество пользователей, через запятую')
+    parser.add_argument('--number', type=int, default=200, help='Запросов на сценарий')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--output', default='bench_auth.json')
+    args = parser.parse_args()
+
+    connection = setup_django()
+    try:
+        results = []
+        for seed, size in enumerate(int(size) for size in args.sizes.split(',')):
+            results.extend(run_scenarios(size, seed, args.number, args.scenarios.split(',')))
+    finally:
+        vendor = connection.vendor
+        teardown_django(connection)
+
+    print_table(results)
+    write_results(args.output, results, database=vendor, number=args.number)
+
+
+if __name__ == '__main__':
+    main()
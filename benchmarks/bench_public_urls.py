@@ -0,0 +1,58 @@
+"""
+Стоимость классификации пути (публичный / защищённый) на один запрос:
+старый цикл re.match по списку строк против PublicURLMatcher.
+
+    python benchmarks/bench_public_urls.py [--number 200000]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_app.public_urls import PublicURLMatcher  # noqa: E402
+
+PUBLIC_URLS = [
+    r'^/api/auth/register/$',
+    r'^/api/auth/login/$',
+    r'^/admin/',
+    r'^/admin/login/',
+    r'^/api/docs/',
+]
+
+PATHS = {
+    'hit_first': '/api/auth/register/',
+    'hit_last': '/api/docs/schema/',
+    'miss': '/api/auth/profile/',
+    'miss_long': '/api/auth/access-rules/12345/',
+}
+
+
+def legacy_is_public(path):
+    for pattern in PUBLIC_URLS:
+        if re.match(pattern, path):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200000)
+    args = parser.parse_args()
+
+    matcher = PublicURLMatcher(PUBLIC_URLS, include_views=False)
+
+    print(f'{"path":<12} {"legacy ns":>10} {"compiled ns":>12} {"speedup":>8}')
+    for name, path in PATHS.items():
+        assert legacy_is_public(path) == matcher.match(path)
+        legacy = timeit.timeit(lambda: legacy_is_public(path), number=args.number)
+        compiled = timeit.timeit(lambda: matcher.match(path), number=args.number)
+        legacy_ns = legacy / args.number * 1e9
+        compiled_ns = compiled / args.number * 1e9
+        print(f'{name:<12} {legacy_ns:>10.0f} {compiled_ns:>12.0f} {legacy_ns / compiled_ns:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
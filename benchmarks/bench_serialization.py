@@ -0,0 +1,71 @@
+"""
+Стоимость сериализации и рендеринга одного ответа: ModelSerializer + JSONRenderer
+из DRF против AttrSerializer + FastJSONRenderer (orjson, если установлен).
+Объекты строятся в памяти, БД не нужна.
+
+    python benchmarks/bench_serialization.py [--number 20000] [--output bench_serialization.json]
+"""
+import argparse
+import os
+from datetime import datetime, timezone
+
+from common import measure, print_table, summarize, write_results
+
+
+def build_objects():
+    from django.contrib.auth.models import User
+    from auth_app.models import Role, UserProfile
+
+    role = Role(id=2, name='user')
+    user = User(id=1, username='user', email='user@example.com', first_name='Иван', last_name='Иванов')
+    profile = UserProfile(
+        id=1, user=user, role=role, middle_name='Петрович',
+        created_at=datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc),
+    )
+    return user, profile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000, help='Ответов на сценарий')
+    parser.add_argument('--output', default='bench_serialization.json')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    from rest_framework.renderers import JSONRenderer
+    from auth_app.renderers import FastJSONRenderer, orjson
+    from auth_app.serializers import UserProfileSerializer, fast_login_user_serializer, fast_profile_serializer
+    from auth_app.views import LoginView, MockUsersView
+
+    user, profile = build_objects()
+    tokens = {'token': 'a' * 200, 'refresh': 'b' * 200}
+    drf, fast = JSONRenderer(), FastJSONRenderer()
+
+    def drf_login_user(obj):
+        return {'id': obj.id, 'email': obj.email, 'first_name': obj.first_name, 'last_name': obj.last_name}
+
+    scenarios = {
+        'profile_drf': lambda i: drf.render(UserProfileSerializer(profile).data),
+        'profile_fast': lambda i: fast.render(fast_profile_serializer.to_representation(profile)),
+        'login_drf': lambda i: drf.render({**LoginView.get_response_data(user, tokens), 'user': drf_login_user(user)}),
+        'login_fast': lambda i: fast.render(LoginView.get_response_data(user, tokens)),
+        'mock_drf': lambda i: drf.render(MockUsersView.mock_response),
+        'mock_fast': lambda i: fast.render(MockUsersView.mock_response),
+    }
+    # одинаковый результат - условие честного сравнения
+    assert fast_profile_serializer.to_representation(profile) == UserProfileSerializer(profile).data
+    assert fast_login_user_serializer.to_representation(user) == drf_login_user(user)
+
+    results = []
+    for scenario, fn in scenarios.items():
+        results.append({'size': 1, 'scenario': scenario, **summarize(measure(fn, args.number, warmup=100))})
+
+    print_table(results)
+    write_results(args.output, results, number=args.number, orjson=orjson is not None)
+
+
+if __name__ == '__main__':
+    main()
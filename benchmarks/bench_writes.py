@@ -0,0 +1,70 @@
+"""
+Запись на профиль: количество SQL-запросов и объём SQL (байт текста запросов
+с подставленными параметрами) для PUT /profile/ (с изменением и без) и
+удаления аккаунта.
+
+    BENCH_DB=sqlite python benchmarks/bench_writes.py [--output bench_writes.json]
+"""
+import argparse
+
+from common import setup_django, teardown_django, write_results
+
+SCENARIOS = ['profile_put_changed', 'profile_put_unchanged', 'delete_account']
+
+
+def run(scenario):
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from auth_app.models import UserProfile
+    from auth_app.utils import JWTManager
+
+    user = User.objects.create(username=f'writes-{scenario}', email=f'writes-{scenario}@example.com',
+                               first_name='Иван', last_name='Иванов')
+    UserProfile.objects.create(user=user, middle_name='Петрович')
+    client = Client()
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {JWTManager.create_token(user)}'}
+
+    if scenario == 'delete_account':
+        request = lambda: client.post('/api/auth/delete-account/', **auth)  # noqa: E731
+    else:
+        middle_name = 'Сергеевич' if scenario == 'profile_put_changed' else 'Петрович'
+        data = {'middle_name': middle_name, 'first_name': 'Иван', 'last_name': 'Иванов'}
+        request = lambda: client.put('/api/auth/profile/', data, content_type='application/json', **auth)  # noqa: E731
+
+    with CaptureQueriesContext(connection) as context:
+        response = request()
+    queries = context.captured_queries
+    writes = [q for q in queries if q['sql'].lstrip().split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+    return {
+        'scenario': scenario,
+        'status': response.status_code,
+        'queries': len(queries),
+        'writes': len(writes),
+        'sql_bytes': sum(len(q['sql'].encode()) for q in queries),
+        'write_sql_bytes': sum(len(q['sql'].encode()) for q in writes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='bench_writes.json')
+    args = parser.parse_args()
+
+    connection = setup_django()
+    try:
+        results = [run(scenario) for scenario in SCENARIOS]
+    finally:
+        vendor = connection.vendor
+        teardown_django(connection)
+
+    print(f'{"scenario":<24} {"status":>6} {"queries":>8} {"writes":>7} {"sql bytes":>10} {"write bytes":>12}')
+    for row in results:
+        print(f'{row["scenario"]:<24} {row["status"]:>6} {row["queries"]:>8} {row["writes"]:>7} '
+              f'{row["sql_bytes"]:>10} {row["write_sql_bytes"]:>12}')
+    write_results(args.output, results, database=vendor)
+
+
+if __name__ == '__main__':
+    main()
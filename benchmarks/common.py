@@ -0,0 +1,83 @@
+"""Общие функции бенчмарков: настройка Django, замеры, запись результатов."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def setup_django():
+    # Django с настройками бенчмарков и отдельной тестовой БД
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return connection
+
+
+def teardown_django(connection):
+    connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+
+
+def measure(fn, number, warmup=5):
+    # время каждого вызова в секундах
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(warmup, warmup + number):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'n': len(samples),
+        'throughput_rps': round(len(samples) / sum(samples), 1),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(quantiles[49] * 1000, 3),
+        'p95_ms': round(quantiles[94] * 1000, 3),
+        'p99_ms': round(quantiles[98] * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results, **meta):
+    # JSON для сравнения между коммитами
+    data = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            **meta,
+        },
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(data, output, ensure_ascii=False, indent=2)
+
+
+def print_table(results):
+    print(f'{"size":>8} {"scenario":<24} {"rps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for row in results:
+        print(f'{row["size"]:>8} {row["scenario"]:<24} {row["throughput_rps"]:>9} '
+              f'{row["p50_ms"]:>9} {row["p95_ms"]:>9} {row["p99_ms"]:>9}')
@@ -0,0 +1,27 @@
+# Настройки для бенчмарков: как в проекте, но БД выбирается через BENCH_DB
+# (sqlite - по умолчанию, postgres - настройки POSTGRES_* из окружения)
+from auth_system.settings import *  # noqa: F401,F403
+from auth_system.settings import BASE_DIR, config
+
+if config('BENCH_DB', default='sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(BASE_DIR / 'bench.sqlite3'),
+            'ATOMIC_REQUESTS': True,
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(BASE_DIR / 'bench.sqlite3'),
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+
+ALLOWED_HOSTS = ['testserver', 'localhost']
+
+# бенчмарк логинится одним пользователем сотни раз подряд
+LOGIN_THROTTLE_ENABLED = False
+
+# без фонового потока сброса активности входа: он писал бы в БД во время
+# замеров и после её удаления; записи сбрасываются по размеру буфера
+LOGIN_ACTIVITY_FLUSH_INTERVAL_MS = 0